@@ -1,7 +1,14 @@
 import os
+import sys
+import gzip
+import json
 import time
+import signal
 import sqlite3
 import asyncio
+import traceback
+from collections import deque
+from dataclasses import dataclass
 import discord
 from discord.ext import commands
 from discord import app_commands
@@ -11,23 +18,91 @@ from discord import app_commands
 # =========================
 
 TOKEN = os.getenv("DISCORD_TOKEN")
+ROSTER_DB = os.getenv("ROSTER_DB", "roster.db")
+RECORD_EVENTS_PATH = os.getenv("RECORD_EVENTS")  # e.g. events.ndjson.gz; replay with replay.py
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "standings.json")  # .json, .ndjson or .db/.sqlite; empty disables
+SNAPSHOT_DEBOUNCE_SECONDS = 1.0  # changes within this window are written out together
+PLAYER_FLUSH_SECONDS = 15  # staged display-name / category changes are written to players this often
+# default roster rules for guilds that haven't configured their own (see /addtier, /setrosterlimits)
 MAX_TEAM_SIZE = 22
+MAX_MANAGERS = 1
+MAX_CO_MANAGERS = 1
 TIER_CAPS = {
     "TOP 1-3": 4,
     "TOP 4-10": 4,
     "TOP 11-20": 4
 }
+# legacy guild_roles columns holding the default tiers' role ids
+LEGACY_TIER_COLUMNS = {
+    "TOP 1-3": "tier_1_3_role_id",
+    "TOP 4-10": "tier_4_10_role_id",
+    "TOP 11-20": "tier_11_20_role_id",
+}
 WARN_COOLDOWN_SECONDS = 60  # over-cap DM warning cooldown per team
+ANNOUNCE_DIGEST_WINDOW_SECONDS = 5  # announcements queued within this window are merged into one post
+ANNOUNCE_RATE_LIMIT = 4             # max announcement posts per channel...
+ANNOUNCE_RATE_PERIOD = 10           # ...per this many seconds
+ANNOUNCE_RETRY_SECONDS = 30         # back-off after a failed post before retrying that channel
+ANNOUNCE_MAX_ATTEMPTS = 5           # a batch that keeps failing is dropped so the rest of the channel can post
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))  # in-process job workers; set to 0 when running `bot.py --worker`
+JOB_MAX_ATTEMPTS = 6
+JOB_BASE_BACKOFF_SECONDS = 2
+JOB_MAX_BACKOFF_SECONDS = 300
+JOB_LEASE_SECONDS = 120  # a job still "running" after this long is assumed lost (crash) and re-queued
+JOB_POLL_SECONDS = 5     # idle workers re-check the queue this often (picks up retries / other processes)
+ACK_WARN_SECONDS = 2.0  # log interaction acknowledgements slower than this (Discord's deadline is 3s)
+ANNOUNCE_DIGEST_TITLES = {
+    "signing": "✍️ Signings",
+    "release": "🗞️ Releases",
+}
 
 # cooldown memory
 _last_warn_at: dict[int, float] = {}  # team_role_id -> last warn ts
 
+# compiled roster rules per guild (invalidated whenever that guild's rules change)
+_rules_cache: dict[int, "RosterRules"] = {}
+
+# announcement pipeline state
+_announce_sent_at: dict[int, deque] = {}       # channel_id -> recent post timestamps
+_announce_blocked_until: dict[int, float] = {}  # channel_id -> retry-after ts
+_announce_failures: dict[int, int] = {}         # channel_id -> consecutive failed posts of the head batch
+_announce_wakeup = asyncio.Event()
+_announce_task: asyncio.Task | None = None
+
+# standings snapshot state
+_snapshot_teams: dict[int, dict] = {}    # team_role_id -> exported team entry
+_snapshot_dirty_teams: set[int] = set()  # teams to rebuild before the next write
+_snapshot_wakeup = asyncio.Event()
+_snapshot_task: asyncio.Task | None = None
+
+# player name cache: what's stored in players, plus changes waiting for the next bulk write
+_player_cache: dict[int, list] = {}                      # player_id -> [name, category, team_role_id]
+_pending_player_details: dict[int, tuple[str, str]] = {}  # player_id -> (name, category)
+_stale_category_guilds: set[int] = set()                  # guilds whose rules changed; restage every player
+_player_flush_task: asyncio.Task | None = None
+
+# job queue state
+_job_wakeup = asyncio.Event()
+_job_tasks: list[asyncio.Task] = []
+_jobs_paused_until = 0.0  # set when Discord rate-limits us; all workers wait it out
+
+# recent interaction acknowledgement latencies, in seconds
+_ack_latencies: deque = deque(maxlen=500)
+
+# event recording state (only used when RECORD_EVENTS is set)
+_record_file = None
+_record_started = 0.0
+_record_count = 0
+_record_ids: dict[int, int] = {}  # real snowflake -> small pseudonymous id
+_record_renames: dict[int, int] = {}  # real user id -> display-name changes seen (names themselves are never kept)
+
 # =========================
 # DB SETUP
 # =========================
 
-conn = sqlite3.connect("roster.db")
+conn = sqlite3.connect(ROSTER_DB, timeout=10)
 c = conn.cursor()
+c.execute("PRAGMA journal_mode=WAL")  # lets a separate `--worker` process share the DB
 
 c.execute("""
 CREATE TABLE IF NOT EXISTS players (
@@ -37,6 +112,10 @@ CREATE TABLE IF NOT EXISTS players (
 )
 """)
 
+# roster category label as of the last name-cache flush (see PLAYER NAME CACHE)
+if "player_category" not in {row[1] for row in c.execute("PRAGMA table_info(players)")}:
+    c.execute("ALTER TABLE players ADD COLUMN player_category TEXT")
+
 c.execute("""
 CREATE TABLE IF NOT EXISTS guild_settings (
     guild_id INTEGER PRIMARY KEY,
@@ -75,6 +154,54 @@ CREATE TABLE IF NOT EXISTS guild_admin_roles (
 )
 """)
 
+# queued signing/release announcements (survive restarts until posted)
+c.execute("""
+CREATE TABLE IF NOT EXISTS announcement_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    text TEXT NOT NULL,
+    queued_at REAL NOT NULL
+)
+""")
+
+# per-guild roster rules; a guild without a row uses the defaults in CONFIG
+c.execute("""
+CREATE TABLE IF NOT EXISTS guild_rules (
+    guild_id INTEGER PRIMARY KEY,
+    max_team_size INTEGER NOT NULL,
+    max_managers INTEGER NOT NULL,
+    max_co_managers INTEGER NOT NULL
+)
+""")
+
+c.execute("""
+CREATE TABLE IF NOT EXISTS guild_tiers (
+    guild_id INTEGER,
+    tier_name TEXT,
+    role_id INTEGER,
+    cap INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, tier_name)
+)
+""")
+
+# durable side-effect jobs (role edits, DM warnings)
+c.execute("""
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_key TEXT UNIQUE,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at REAL NOT NULL,
+    claimed_at REAL,
+    last_error TEXT
+)
+""")
+c.execute("CREATE INDEX IF NOT EXISTS jobs_status_run_at ON jobs (status, run_at)")
+
 conn.commit()
 
 # =========================
@@ -95,41 +222,48 @@ def get_player_team(player_id: int):
     r = c.fetchone()
     return r[0] if r else None
 
-def add_or_update_player(player_id: int, player_name: str, team_role_id: int | None):
-    c.execute("SELECT 1 FROM players WHERE player_id=?", (player_id,))
-    if c.fetchone():
-        c.execute("UPDATE players SET player_name=?, team_role_id=? WHERE player_id=?",
-                  (player_name, team_role_id, player_id))
+def add_or_update_player(player_id: int, player_name: str, team_role_id: int | None, player_category: str | None = None):
+    c.execute("SELECT team_role_id, player_category FROM players WHERE player_id=?", (player_id,))
+    r = c.fetchone()
+    if r:
+        player_category = player_category or r[1]
+        c.execute("UPDATE players SET player_name=?, team_role_id=?, player_category=? WHERE player_id=?",
+                  (player_name, team_role_id, player_category, player_id))
+        mark_team_changed(r[0])
     else:
-        c.execute("INSERT INTO players (player_id, player_name, team_role_id) VALUES (?, ?, ?)",
-                  (player_id, player_name, team_role_id))
+        c.execute("INSERT INTO players (player_id, player_name, team_role_id, player_category) VALUES (?, ?, ?, ?)",
+                  (player_id, player_name, team_role_id, player_category))
     conn.commit()
+    _player_cache[player_id] = [player_name, player_category, team_role_id]
+    _pending_player_details.pop(player_id, None)  # this write is newer than anything staged
+    mark_team_changed(team_role_id)
 
 def remove_player_from_team(player_id: int):
+    mark_team_changed(get_player_team(player_id))
     c.execute("UPDATE players SET team_role_id=NULL WHERE player_id=?", (player_id,))
     conn.commit()
+    if player_id in _player_cache:
+        _player_cache[player_id][2] = None
 
 def get_team_roster(team_role_id: int):
-    c.execute("SELECT player_name FROM players WHERE team_role_id=?", (team_role_id,))
-    return [r[0] for r in c.fetchall()]
+    """(player_id, player_name, player_category) rows, straight from storage (no member cache needed).
+
+    Details staged for the next bulk write are applied on top, so rosters and cap checks agree right away.
+    """
+    c.execute("SELECT player_id, player_name, player_category FROM players WHERE team_role_id=?", (team_role_id,))
+    return [(pid, *_pending_player_details.get(pid, (name, category))) for pid, name, category in c.fetchall()]
 
 def get_guild_roles(guild_id: int):
-    c.execute("""
-        SELECT manager_role_id, co_manager_role_id, tier_1_3_role_id, tier_4_10_role_id, tier_11_20_role_id
-        FROM guild_roles WHERE guild_id=?
-    """, (guild_id,))
+    c.execute("SELECT manager_role_id, co_manager_role_id FROM guild_roles WHERE guild_id=?", (guild_id,))
     r = c.fetchone()
     if not r:
-        return {"manager": None, "co_manager": None, "t1_3": None, "t4_10": None, "t11_20": None}
-    return {"manager": r[0], "co_manager": r[1], "t1_3": r[2], "t4_10": r[3], "t11_20": r[4]}
+        return {"manager": None, "co_manager": None}
+    return {"manager": r[0], "co_manager": r[1]}
 
 def set_guild_role(guild_id: int, key: str, role_id: int):
     cols = {
         "manager": "manager_role_id",
         "co_manager": "co_manager_role_id",
-        "t1_3": "tier_1_3_role_id",
-        "t4_10": "tier_4_10_role_id",
-        "t11_20": "tier_11_20_role_id",
     }
     col = cols[key]
     c.execute(f"""
@@ -137,6 +271,9 @@ def set_guild_role(guild_id: int, key: str, role_id: int):
         ON CONFLICT(guild_id) DO UPDATE SET {col}=excluded.{col}
     """, (guild_id, role_id))
     conn.commit()
+    _rules_cache.pop(guild_id, None)
+    _stale_category_guilds.add(guild_id)
+    mark_all_teams_changed()
 
 def resolve_configured_role(guild: discord.Guild, role_id: int | None) -> discord.Role | None:
     return guild.get_role(role_id) if role_id else None
@@ -146,50 +283,13 @@ def ensure_rank_roles_exist(guild: discord.Guild):
     return resolve_configured_role(guild, cfg["manager"]), resolve_configured_role(guild, cfg["co_manager"])
 
 def get_player_category(member: discord.Member):
-    cfg = get_guild_roles(member.guild.id)
-    role_ids = {r.id for r in member.roles}
-
-    if cfg["manager"] and cfg["manager"] in role_ids:
-        return "manager"
-    if cfg["co_manager"] and cfg["co_manager"] in role_ids:
-        return "co_manager"
-
-    if cfg["t1_3"] and cfg["t1_3"] in role_ids:
-        return ("tiered", "TOP 1-3")
-    if cfg["t4_10"] and cfg["t4_10"] in role_ids:
-        return ("tiered", "TOP 4-10")
-    if cfg["t11_20"] and cfg["t11_20"] in role_ids:
-        return ("tiered", "TOP 11-20")
-
-    # Fallback to names if not configured yet
-    for r in member.roles:
-        if r.name == "Manager":
-            return "manager"
-        if r.name == "Co-Manager":
-            return "co_manager"
-    for r in member.roles:
-        if r.name in TIER_CAPS:
-            return ("tiered", r.name)
-
-    return "unranked"
+    return get_roster_rules(member.guild.id).category_of(member)
 
 def count_team_categories(team_role_id: int, guild: discord.Guild):
-    manager_count = 0
-    co_manager_count = 0
-    tier_counts = {tier: 0 for tier in TIER_CAPS}
-    unranked_count = 0
-    for m in guild.members:
-        if get_player_team(m.id) == team_role_id:
-            cat = get_player_category(m)
-            if cat == "manager":
-                manager_count += 1
-            elif cat == "co_manager":
-                co_manager_count += 1
-            elif isinstance(cat, tuple) and cat[0] == "tiered":
-                tier_counts[cat[1]] += 1
-            else:
-                unranked_count += 1
-    return manager_count, co_manager_count, tier_counts, unranked_count
+    rules = get_roster_rules(guild.id)
+    counts = count_stored_categories(rules, team_role_id)
+    tier_counts = {tier: counts.get(("tiered", tier), 0) for tier in rules.tier_caps}
+    return counts.get("manager", 0), counts.get("co_manager", 0), tier_counts, counts.get("unranked", 0)
 
 # channel settings
 def set_signing_channel(guild_id: int, channel_id: int):
@@ -224,6 +324,7 @@ def register_team(team_role_id: int, team_name: str):
                 COALESCE((SELECT co_manager_id FROM teams WHERE team_role_id=?), NULL))
     """, (team_role_id, team_name, team_role_id, team_role_id))
     conn.commit()
+    mark_team_changed(team_role_id)
 
 def get_team_record(team_role_id: int):
     c.execute("SELECT team_role_id, team_name, manager_id, co_manager_id FROM teams WHERE team_role_id=?", (team_role_id,))
@@ -235,10 +336,12 @@ def get_team_record(team_role_id: int):
 def set_team_manager(team_role_id: int, manager_id: int | None):
     c.execute("UPDATE teams SET manager_id=? WHERE team_role_id=?", (manager_id, team_role_id))
     conn.commit()
+    mark_team_changed(team_role_id)
 
 def set_team_co_manager(team_role_id: int, co_manager_id: int | None):
     c.execute("UPDATE teams SET co_manager_id=? WHERE team_role_id=?", (co_manager_id, team_role_id))
     conn.commit()
+    mark_team_changed(team_role_id)
 
 def is_user_manager_of_team(user_id: int, team_role_id: int) -> bool:
     rec = get_team_record(team_role_id)
@@ -264,6 +367,10 @@ def remove_admin_role(guild_id: int, role_id: int):
     c.execute("DELETE FROM guild_admin_roles WHERE guild_id=? AND role_id=?", (guild_id, role_id))
     conn.commit()
 
+def can_manage_role(guild: discord.Guild, role: discord.Role) -> bool:
+    me = guild.me
+    return bool(me and me.guild_permissions.manage_roles and role < me.top_role)
+
 def is_custom_admin(member: discord.Member) -> bool:
     guild = member.guild
     admin_ids = get_admin_role_ids(guild.id)
@@ -277,23 +384,545 @@ def is_custom_admin(member: discord.Member) -> bool:
     return False
 
 # =========================
-# OVER-CAP WARNINGS
+# ROSTER RULES (per guild, compiled + cached)
 # =========================
 
-def relevant_rank_role_ids(guild: discord.Guild):
-    cfg = get_guild_roles(guild.id)
-    return {rid for rid in [cfg["manager"], cfg["co_manager"], cfg["t1_3"], cfg["t4_10"], cfg["t11_20"]] if rid}
+@dataclass(frozen=True)
+class RosterRules:
+    """A guild's roster rules, compiled to lookup tables so each check is O(roles).
+
+    Categories are "manager", "co_manager", ("tiered", tier_name) or "unranked".
+    """
+    max_team_size: int
+    max_managers: int
+    max_co_managers: int
+    tier_caps: dict[str, int]                    # tier name -> cap, in display order
+    role_categories: dict[int, tuple[int, object]]   # configured role id -> (priority, category)
+    name_categories: dict[str, tuple[int, object]]   # role-name fallback -> (priority, category)
+
+    @property
+    def tracked_role_ids(self) -> set[int]:
+        return set(self.role_categories)
+
+    @property
+    def tracked_role_names(self) -> set[str]:
+        return set(self.name_categories)
+
+    def category_of(self, member: discord.Member):
+        best = None
+        for r in member.roles:
+            hit = self.role_categories.get(r.id)
+            if hit and (best is None or hit[0] < best[0]):
+                best = hit
+        if best is None:
+            # Fallback to names if not configured yet
+            for r in member.roles:
+                hit = self.name_categories.get(r.name)
+                if hit and (best is None or hit[0] < best[0]):
+                    best = hit
+        return best[1] if best else "unranked"
+
+    def cap_for(self, category) -> int | None:
+        if category == "manager":
+            return self.max_managers
+        if category == "co_manager":
+            return self.max_co_managers
+        if isinstance(category, tuple):
+            return self.tier_caps.get(category[1])
+        return None
 
-def get_team_staff(guild: discord.Guild, team_role_id: int):
-    managers, co_managers = [], []
-    for m in guild.members:
-        if get_player_team(m.id) == team_role_id:
-            cat = get_player_category(m)
-            if cat == "manager":
-                managers.append(m)
-            elif cat == "co_manager":
-                co_managers.append(m)
-    return managers, co_managers
+    def signing_block(self, counts: dict, category) -> str | None:
+        """Why a player of this category can't join a team with these counts, or None if they can."""
+        if sum(counts.values()) >= self.max_team_size:
+            return f"❌ Team roster is full ({self.max_team_size})."
+        cap = self.cap_for(category)
+        if cap is not None and counts.get(category, 0) >= cap:
+            if category == "manager":
+                return "❌ Manager spot already filled."
+            if category == "co_manager":
+                return "❌ Co-Manager spot already filled."
+            return f"❌ Tier {category[1]} is full."
+        return None
+
+    def overages(self, counts: dict) -> list[tuple[str, int, int]]:
+        return [(tier, counts.get(("tiered", tier), 0), cap)
+                for tier, cap in self.tier_caps.items() if counts.get(("tiered", tier), 0) > cap]
+
+def compile_roster_rules(guild_id: int) -> RosterRules:
+    c.execute("SELECT max_team_size, max_managers, max_co_managers FROM guild_rules WHERE guild_id=?", (guild_id,))
+    limits = c.fetchone()
+    if limits:
+        c.execute("SELECT tier_name, role_id, cap FROM guild_tiers WHERE guild_id=? ORDER BY position", (guild_id,))
+        tiers = c.fetchall()
+    else:
+        limits = (MAX_TEAM_SIZE, MAX_MANAGERS, MAX_CO_MANAGERS)
+        tiers = [(tier, None, cap) for tier, cap in TIER_CAPS.items()]
+    cfg = get_guild_roles(guild_id)
+
+    role_categories = {}
+    name_categories = {"Manager": (0, "manager"), "Co-Manager": (1, "co_manager")}
+    if cfg["manager"]:
+        role_categories[cfg["manager"]] = (0, "manager")
+    if cfg["co_manager"]:
+        role_categories.setdefault(cfg["co_manager"], (1, "co_manager"))
+    for priority, (tier, role_id, _) in enumerate(tiers, start=2):
+        if role_id:
+            role_categories.setdefault(role_id, (priority, ("tiered", tier)))
+        name_categories.setdefault(tier, (priority, ("tiered", tier)))
+
+    return RosterRules(
+        max_team_size=limits[0], max_managers=limits[1], max_co_managers=limits[2],
+        tier_caps={tier: cap for tier, _, cap in tiers},
+        role_categories=role_categories, name_categories=name_categories,
+    )
+
+def get_roster_rules(guild_id: int) -> RosterRules:
+    rules = _rules_cache.get(guild_id)
+    if rules is None:
+        rules = _rules_cache[guild_id] = compile_roster_rules(guild_id)
+    return rules
+
+def ensure_guild_rules(guild_id: int):
+    """Materialize the default rules (and any legacy tier roles) before a guild's first edit."""
+    c.execute("SELECT 1 FROM guild_rules WHERE guild_id=?", (guild_id,))
+    if c.fetchone():
+        return
+    c.execute("INSERT INTO guild_rules (guild_id, max_team_size, max_managers, max_co_managers) VALUES (?, ?, ?, ?)",
+              (guild_id, MAX_TEAM_SIZE, MAX_MANAGERS, MAX_CO_MANAGERS))
+    c.execute(f"SELECT {', '.join(LEGACY_TIER_COLUMNS.values())} FROM guild_roles WHERE guild_id=?", (guild_id,))
+    legacy = dict(zip(LEGACY_TIER_COLUMNS, c.fetchone() or ()))
+    for position, (tier, cap) in enumerate(TIER_CAPS.items()):
+        role_id = legacy.get(tier)
+        c.execute("INSERT OR IGNORE INTO guild_tiers (guild_id, tier_name, role_id, cap, position) VALUES (?, ?, ?, ?, ?)",
+                  (guild_id, tier, role_id, cap, position))
+    conn.commit()
+
+def migrate_legacy_tier_roles():
+    # guilds that configured the three fixed tiers before per-guild rules existed
+    c.execute(f"""
+        SELECT guild_id FROM guild_roles
+        WHERE COALESCE({', '.join(LEGACY_TIER_COLUMNS.values())}) IS NOT NULL
+          AND guild_id NOT IN (SELECT guild_id FROM guild_rules)
+    """)
+    for (guild_id,) in c.fetchall():
+        ensure_guild_rules(guild_id)
+
+def set_roster_limits(guild_id: int, max_team_size: int | None, max_managers: int | None, max_co_managers: int | None):
+    ensure_guild_rules(guild_id)
+    c.execute("""
+        UPDATE guild_rules SET max_team_size=COALESCE(?, max_team_size), max_managers=COALESCE(?, max_managers),
+                               max_co_managers=COALESCE(?, max_co_managers)
+        WHERE guild_id=?
+    """, (max_team_size, max_managers, max_co_managers, guild_id))
+    conn.commit()
+    _rules_cache.pop(guild_id, None)
+    _stale_category_guilds.add(guild_id)
+    mark_all_teams_changed()
+
+def upsert_tier(guild_id: int, tier_name: str, cap: int, role_id: int | None):
+    ensure_guild_rules(guild_id)
+    c.execute("""
+        INSERT INTO guild_tiers (guild_id, tier_name, role_id, cap, position)
+        VALUES (?, ?, ?, ?, (SELECT COALESCE(MAX(position), -1) + 1 FROM guild_tiers WHERE guild_id=?))
+        ON CONFLICT(guild_id, tier_name) DO UPDATE SET cap=excluded.cap, role_id=COALESCE(excluded.role_id, role_id)
+    """, (guild_id, tier_name, role_id, cap, guild_id))
+    conn.commit()
+    _rules_cache.pop(guild_id, None)
+    _stale_category_guilds.add(guild_id)
+    mark_all_teams_changed()
+
+def remove_tier(guild_id: int, tier_name: str) -> bool:
+    ensure_guild_rules(guild_id)
+    c.execute("DELETE FROM guild_tiers WHERE guild_id=? AND tier_name=?", (guild_id, tier_name))
+    removed = c.rowcount > 0
+    conn.commit()
+    _rules_cache.pop(guild_id, None)
+    _stale_category_guilds.add(guild_id)
+    mark_all_teams_changed()
+    return removed
+
+def set_tier_role(guild_id: int, tier_name: str, role_id: int) -> bool:
+    ensure_guild_rules(guild_id)
+    c.execute("UPDATE guild_tiers SET role_id=? WHERE guild_id=? AND tier_name=?", (role_id, guild_id, tier_name))
+    updated = c.rowcount > 0
+    conn.commit()
+    _rules_cache.pop(guild_id, None)
+    _stale_category_guilds.add(guild_id)
+    mark_all_teams_changed()
+    return updated
+
+migrate_legacy_tier_roles()
+
+# =========================
+# STANDINGS SNAPSHOT (read-only export for dashboards)
+# =========================
+
+def mark_team_changed(team_role_id: int | None):
+    if team_role_id:
+        _snapshot_dirty_teams.add(team_role_id)
+        _snapshot_wakeup.set()
+
+def mark_all_teams_changed():
+    c.execute("SELECT team_role_id FROM teams")
+    _snapshot_dirty_teams.update(r[0] for r in c.fetchall())
+    _snapshot_wakeup.set()
+
+def snapshot_guilds():
+    return bot.guilds
+
+def category_label(category) -> str:
+    # tiers are prefixed so a tier name can never read back as "manager", "unranked", ...
+    return f"tier:{category[1]}" if isinstance(category, tuple) else category
+
+def stored_category(rules: RosterRules, label: str | None):
+    """Turn a stored label back into a category; a tier since removed from the rules counts as unranked."""
+    if label in ("manager", "co_manager"):
+        return label
+    if label and label.startswith("tier:") and label[5:] in rules.tier_caps:
+        return ("tiered", label[5:])
+    return "unranked"
+
+def count_stored_categories(rules: RosterRules, team_role_id: int) -> dict:
+    """Category counts for the stored roster: the same players /roster and the snapshot show, departed members included."""
+    counts = {}
+    for _, _, label in get_team_roster(team_role_id):
+        cat = stored_category(rules, label)
+        counts[cat] = counts.get(cat, 0) + 1
+    return counts
+
+def build_team_snapshot(guild: discord.Guild, team_role_id: int) -> dict | None:
+    rec = get_team_record(team_role_id)
+    if not rec:
+        return None
+    rules = get_roster_rules(guild.id)
+    players, counts = [], {"manager": 0, "co_manager": 0, "unranked": 0, "tiers": {tier: 0 for tier in rules.tier_caps}}
+    for player_id, name, category in get_team_roster(team_role_id):
+        cat = stored_category(rules, category)
+        if isinstance(cat, tuple):
+            counts["tiers"][cat[1]] += 1
+            players.append({"id": player_id, "name": name, "category": "tiered", "tier": cat[1]})
+        else:
+            counts[cat] += 1
+            players.append({"id": player_id, "name": name, "category": cat, "tier": None})
+    names = {p["id"]: p["name"] for p in players}
+    return {
+        "guild_id": guild.id,
+        "team_role_id": team_role_id,
+        "team_name": rec["team_name"],
+        "manager": {"id": rec["manager_id"], "name": names.get(rec["manager_id"])} if rec["manager_id"] else None,
+        "co_manager": {"id": rec["co_manager_id"], "name": names.get(rec["co_manager_id"])} if rec["co_manager_id"] else None,
+        "total": len(players),
+        "max_team_size": rules.max_team_size,
+        "counts": counts,
+        "tier_caps": rules.tier_caps,
+        "players": players,
+        "updated_at": time.time(),
+    }
+
+def refresh_dirty_snapshots():
+    dirty = list(_snapshot_dirty_teams)
+    _snapshot_dirty_teams.clear()
+    guilds = snapshot_guilds()
+    for team_role_id in dirty:
+        guild = next((g for g in guilds if g.get_role(team_role_id)), None)
+        entry = build_team_snapshot(guild, team_role_id) if guild else None
+        if entry:
+            _snapshot_teams[team_role_id] = entry
+        else:
+            _snapshot_teams.pop(team_role_id, None)
+
+def write_snapshot_file(path: str, teams: list[dict], generated_at: float):
+    """Write to a temp file and rename over the old one, so readers never see a partial file."""
+    tmp = f"{path}.tmp"
+    if path.endswith((".db", ".sqlite", ".sqlite3")):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        out = sqlite3.connect(tmp)
+        out.executescript("""
+            CREATE TABLE meta (generated_at REAL);
+            CREATE TABLE teams (
+                team_role_id INTEGER PRIMARY KEY, guild_id INTEGER, team_name TEXT,
+                manager_id INTEGER, manager_name TEXT, co_manager_id INTEGER, co_manager_name TEXT,
+                total INTEGER, max_team_size INTEGER, counts TEXT, tier_caps TEXT, updated_at REAL
+            );
+            CREATE TABLE players (player_id INTEGER, team_role_id INTEGER, player_name TEXT, category TEXT, tier TEXT);
+            CREATE INDEX players_team ON players (team_role_id);
+        """)
+        out.execute("INSERT INTO meta VALUES (?)", (generated_at,))
+        out.executemany("INSERT INTO teams VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+            (t["team_role_id"], t["guild_id"], t["team_name"],
+             (t["manager"] or {}).get("id"), (t["manager"] or {}).get("name"),
+             (t["co_manager"] or {}).get("id"), (t["co_manager"] or {}).get("name"),
+             t["total"], t["max_team_size"], json.dumps(t["counts"]), json.dumps(t["tier_caps"]), t["updated_at"])
+            for t in teams
+        ])
+        out.executemany("INSERT INTO players VALUES (?, ?, ?, ?, ?)", [
+            (p["id"], t["team_role_id"], p["name"], p["category"], p["tier"]) for t in teams for p in t["players"]
+        ])
+        out.commit()
+        out.close()
+    else:
+        with open(tmp, "w", encoding="utf-8") as f:
+            if path.endswith(".ndjson"):
+                for t in teams:
+                    f.write(json.dumps(t, ensure_ascii=False) + "\n")
+            else:
+                json.dump({"generated_at": generated_at, "teams": teams}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+async def run_snapshot_writer():
+    mark_all_teams_changed()
+    while True:
+        await _snapshot_wakeup.wait()
+        await asyncio.sleep(SNAPSHOT_DEBOUNCE_SECONDS)
+        _snapshot_wakeup.clear()
+        refresh_dirty_snapshots()
+        teams = sorted(_snapshot_teams.values(), key=lambda t: (t["guild_id"], t["team_name"].lower()))
+        try:
+            await asyncio.to_thread(write_snapshot_file, SNAPSHOT_PATH, teams, time.time())
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️ Standings snapshot write failed: {e}")
+
+# =========================
+# PLAYER NAME CACHE (batched writes to players)
+# =========================
+
+def load_player_cache():
+    c.execute("SELECT player_id, player_name, player_category, team_role_id FROM players")
+    for player_id, name, category, team_role_id in c.fetchall():
+        _player_cache[player_id] = [name, category, team_role_id]
+
+def stage_player_details(member: discord.Member):
+    """Queue the member's current display name and category for the next bulk write, if they changed."""
+    cached = _player_cache.get(member.id)
+    if cached is None:
+        return  # not a player we track
+    team_role_id = cached[2]
+    if team_role_id and not member.guild.get_role(team_role_id):
+        return  # a different server than the player's team; its nickname/roles don't apply
+    details = (member.display_name, category_label(get_player_category(member)))
+    if details != (cached[0], cached[1]):
+        _pending_player_details[member.id] = details
+    else:
+        _pending_player_details.pop(member.id, None)
+
+def flush_player_details():
+    for guild in snapshot_guilds():
+        if guild.id in _stale_category_guilds:
+            for m in guild.members:
+                stage_player_details(m)
+    _stale_category_guilds.clear()
+    if not _pending_player_details:
+        return
+    rows = [(name, category, player_id) for player_id, (name, category) in _pending_player_details.items()]
+    _pending_player_details.clear()
+    c.executemany("UPDATE players SET player_name=?, player_category=? WHERE player_id=?", rows)
+    conn.commit()
+    for name, category, player_id in rows:
+        cached = _player_cache[player_id]
+        cached[0], cached[1] = name, category
+        mark_team_changed(cached[2])
+
+async def run_player_details_flusher():
+    while True:
+        flush_player_details()
+        await asyncio.sleep(PLAYER_FLUSH_SECONDS)
+
+load_player_cache()
+
+# =========================
+# JOB QUEUE (durable side effects)
+# =========================
+
+JOB_HANDLERS = {}
+
+def job_handler(kind: str):
+    def register(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return register
+
+def enqueue_job(kind: str, payload: dict, key: str | None = None, delay: float = 0):
+    """Queue a side effect. A job whose key is already pending is not queued twice."""
+    c.execute("""
+        INSERT INTO jobs (job_key, kind, payload, run_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(job_key) DO UPDATE SET
+            kind=excluded.kind, payload=excluded.payload, run_at=excluded.run_at,
+            status='pending', attempts=0, claimed_at=NULL, last_error=NULL
+        WHERE jobs.status NOT IN ('pending', 'running')
+    """, (key, kind, json.dumps(payload), time.time() + delay))
+    conn.commit()
+    _job_wakeup.set()
+
+def queue_role_change(guild_id: int, user_id: int, role_id: int, add: bool, reason: str | None = None,
+                      report_channel_id: int | None = None):
+    # a pending opposite edit for the same member/role is superseded by this one
+    op, opposite = ("add_role", "remove_role") if add else ("remove_role", "add_role")
+    c.execute("DELETE FROM jobs WHERE job_key=? AND status='pending'", (f"{opposite}:{guild_id}:{user_id}:{role_id}",))
+    enqueue_job(op, {"guild_id": guild_id, "user_id": user_id, "role_id": role_id, "reason": reason,
+                     "report_channel_id": report_channel_id},
+                key=f"{op}:{guild_id}:{user_id}:{role_id}")
+
+# a role edit waits while the opposite edit for the same member/role is still running,
+# so an add and a remove can never race each other to Discord
+ROLE_EDIT_NOT_BLOCKED = """NOT EXISTS (SELECT 1 FROM jobs AS other WHERE other.status='running' AND other.job_key =
+    CASE jobs.kind WHEN 'add_role' THEN 'remove_role' || substr(jobs.job_key, 9)
+                   WHEN 'remove_role' THEN 'add_role' || substr(jobs.job_key, 12) END)"""
+
+def claim_next_job():
+    now = time.time()
+    c.execute(f"SELECT id, kind, payload, attempts FROM jobs WHERE status='pending' AND run_at<=? AND {ROLE_EDIT_NOT_BLOCKED} "
+              "ORDER BY run_at, id LIMIT 1", (now,))
+    r = c.fetchone()
+    if not r:
+        return None
+    # guarded on status (and the opposite edit) so a worker in another process can't claim it too
+    c.execute(f"UPDATE jobs SET status='running', claimed_at=? WHERE id=? AND status='pending' AND {ROLE_EDIT_NOT_BLOCKED}", (now, r[0]))
+    conn.commit()
+    if c.rowcount != 1:
+        return None
+    return {"id": r[0], "kind": r[1], "payload": json.loads(r[2]), "attempts": r[3]}
+
+def finish_job(job_id: int):
+    c.execute("DELETE FROM jobs WHERE id=?", (job_id,))
+    conn.commit()
+    _job_wakeup.set()  # an edit waiting on this one may be claimable now
+
+def fail_job(job_id: int, error: str):
+    c.execute("UPDATE jobs SET status='failed', last_error=? WHERE id=?", (error, job_id))
+    conn.commit()
+    _job_wakeup.set()
+
+def retry_job(job: dict, error: str, delay: float | None = None) -> bool:
+    """Schedule another attempt; False once the job has used up its attempts and was failed instead."""
+    attempts = job["attempts"] + 1
+    if attempts >= JOB_MAX_ATTEMPTS:
+        print(f"⚠️ Job {job['id']} ({job['kind']}) failed after {attempts} attempts: {error}")
+        fail_job(job["id"], error); return False
+    backoff = min(JOB_MAX_BACKOFF_SECONDS, JOB_BASE_BACKOFF_SECONDS * 2 ** job["attempts"])
+    c.execute("UPDATE jobs SET status='pending', attempts=?, run_at=?, claimed_at=NULL, last_error=? WHERE id=?",
+              (attempts, time.time() + max(backoff, delay or 0), error, job["id"]))
+    conn.commit()
+    _job_wakeup.set()
+    return True
+
+def requeue_stale_jobs():
+    c.execute("UPDATE jobs SET status='pending', claimed_at=NULL WHERE status='running' AND claimed_at<?",
+              (time.time() - JOB_LEASE_SECONDS,))
+    conn.commit()
+
+def pending_job_count() -> int:
+    c.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')")
+    return c.fetchone()[0]
+
+def pause_jobs(seconds: float):
+    global _jobs_paused_until
+    _jobs_paused_until = max(_jobs_paused_until, time.time() + seconds)
+
+async def report_job_failure(job: dict, error: str):
+    """A role edit that failed for good leaves the roster and Discord out of step; say so where it was asked for."""
+    p = job["payload"]
+    if job["kind"] not in ("add_role", "remove_role") or not p.get("report_channel_id"):
+        return
+    edit = f"add <@&{p['role_id']}> to" if job["kind"] == "add_role" else f"remove <@&{p['role_id']}> from"
+    try:
+        await bot.get_partial_messageable(p["report_channel_id"]).send(
+            f"⚠️ I couldn't {edit} <@{p['user_id']}> ({error}). The roster was already updated, so please fix the role by hand.",
+            allowed_mentions=discord.AllowedMentions.none(),
+        )
+    except discord.HTTPException as e:
+        print(f"⚠️ Could not report failed job {job['id']} to channel {p['report_channel_id']}: {e}")
+
+async def run_job(job: dict):
+    handler = JOB_HANDLERS.get(job["kind"])
+    if handler is None:
+        fail_job(job["id"], f"no handler for job kind {job['kind']!r}"); return
+    try:
+        await handler(job["payload"])
+    except (discord.Forbidden, discord.NotFound) as e:
+        # retrying won't help: missing permissions, or the member/role/channel is gone
+        print(f"⚠️ Job {job['id']} ({job['kind']}) failed: {e}")
+        fail_job(job["id"], str(e))
+        await report_job_failure(job, str(e))
+    except discord.RateLimited as e:
+        pause_jobs(e.retry_after)
+        if not retry_job(job, str(e), delay=e.retry_after):
+            await report_job_failure(job, str(e))
+    except discord.HTTPException as e:
+        if e.status == 429:
+            retry_after = float(e.response.headers.get("Retry-After", JOB_BASE_BACKOFF_SECONDS))
+            pause_jobs(retry_after)
+            requeued = retry_job(job, str(e), delay=retry_after)
+        else:
+            requeued = retry_job(job, str(e))
+        if not requeued:
+            await report_job_failure(job, str(e))
+    except Exception as e:
+        if not retry_job(job, repr(e)):
+            await report_job_failure(job, repr(e))
+    else:
+        finish_job(job["id"])
+
+async def run_job_worker():
+    while True:
+        pause = _jobs_paused_until - time.time()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        _job_wakeup.clear()
+        job = claim_next_job()
+        if job:
+            await run_job(job)
+            continue
+        requeue_stale_jobs()
+        # jobs already due are blocked behind a running edit; finishing it sets the wakeup
+        c.execute("SELECT MIN(run_at) FROM jobs WHERE status='pending' AND run_at>?", (time.time(),))
+        next_run_at = c.fetchone()[0]
+        timeout = JOB_POLL_SECONDS if next_run_at is None else min(JOB_POLL_SECONDS, max(0.0, next_run_at - time.time()))
+        try:
+            await asyncio.wait_for(_job_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+def start_job_workers(count: int):
+    global _job_tasks
+    _job_tasks = [t for t in _job_tasks if not t.done()]
+    for _ in range(count - len(_job_tasks)):
+        _job_tasks.append(asyncio.create_task(run_job_worker()))
+
+async def run_worker_process():
+    """`python bot.py --worker`: run jobs over HTTP only, without a gateway connection."""
+    async with bot:
+        await bot.login(TOKEN)
+        print(f"🛠️ Job worker running as {bot.user}")
+        requeue_stale_jobs()
+        await asyncio.gather(*(run_job_worker() for _ in range(max(1, JOB_WORKERS))))
+
+# job handlers only use IDs + HTTP, so they work in the worker process too
+
+@job_handler("add_role")
+async def job_add_role(p: dict):
+    await bot.http.add_role(p["guild_id"], p["user_id"], p["role_id"], reason=p.get("reason"))
+
+@job_handler("remove_role")
+async def job_remove_role(p: dict):
+    await bot.http.remove_role(p["guild_id"], p["user_id"], p["role_id"], reason=p.get("reason"))
+
+@job_handler("staff_warning")
+async def job_staff_warning(p: dict):
+    sent_any = False
+    for user_id in p["user_ids"]:
+        try:
+            dm = await bot.create_dm(discord.Object(id=user_id))
+            await dm.send(p["text"])
+            sent_any = True
+        except discord.Forbidden:
+            pass
+    if not sent_any and p.get("fallback_channel_id"):
+        await bot.get_partial_messageable(p["fallback_channel_id"]).send(p["text"])
+
+# =========================
+# OVER-CAP WARNINGS
+# =========================
 
 async def check_team_caps_and_warn(guild: discord.Guild, team_role_id: int):
     if team_role_id is None:
@@ -304,18 +933,15 @@ async def check_team_caps_and_warn(guild: discord.Guild, team_role_id: int):
     if now - _last_warn_at.get(team_role_id, 0) < WARN_COOLDOWN_SECONDS:
         return
 
-    _, _, tier_counts, _ = count_team_categories(team_role_id, guild)
+    rules = get_roster_rules(guild.id)
+    roster = [(player_id, name, stored_category(rules, label)) for player_id, name, label in get_team_roster(team_role_id)]
+    counts = {}
+    for _, _, cat in roster:
+        counts[cat] = counts.get(cat, 0) + 1
     overages = []
-    for tier, cap in TIER_CAPS.items():
-        cnt = tier_counts[tier]
-        if cnt > cap:
-            names = []
-            for m in guild.members:
-                if get_player_team(m.id) == team_role_id:
-                    cat = get_player_category(m)
-                    if isinstance(cat, tuple) and cat[0] == "tiered" and cat[1] == tier:
-                        names.append(m.display_name)
-            overages.append((tier, cnt, cap, names))
+    for tier, cnt, cap in rules.overages(counts):
+        names = [name for _, name, cat in roster if cat == ("tiered", tier)]
+        overages.append((tier, cnt, cap, names))
     if not overages:
         return
 
@@ -331,33 +957,279 @@ async def check_team_caps_and_warn(guild: discord.Guild, team_role_id: int):
     lines.append("Please adjust your roster (release or reassign ranks) to return within the caps.")
     text = "\n".join(lines)
 
-    managers, co_managers = get_team_staff(guild, team_role_id)
-    recipients = managers + co_managers
+    staff = [player_id for player_id, _, cat in roster if cat in ("manager", "co_manager")]
+    sc_id = get_signing_channel(guild.id)
+    fallback_id = sc_id or (guild.system_channel.id if guild.system_channel else None)
+    enqueue_job("staff_warning", {
+        "user_ids": staff,
+        "text": text,
+        "fallback_channel_id": fallback_id,
+    }, key=f"staff_warning:{team_role_id}")
 
-    sent_any = False
-    for u in recipients:
+    _last_warn_at[team_role_id] = now
+
+# =========================
+# INTERACTION RESPONSES
+# =========================
+
+async def defer_response(interaction: discord.Interaction, ephemeral: bool = True):
+    """Acknowledge the interaction immediately; the result is sent later via respond()."""
+    await interaction.response.defer(ephemeral=ephemeral, thinking=True)
+    latency = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+    _ack_latencies.append(latency)
+    if latency > ACK_WARN_SECONDS:
+        name = interaction.command.name if interaction.command else "?"
+        print(f"⚠️ Slow acknowledgement for /{name}: {latency:.2f}s")
+
+async def send_progress(interaction: discord.Interaction, text: str):
+    await interaction.edit_original_response(content=text)
+
+async def respond(interaction: discord.Interaction, content: str | None = None, *, embed: discord.Embed | None = None, ephemeral: bool = True):
+    if interaction.response.is_done():
+        await interaction.edit_original_response(content=content, embed=embed)
+    else:
+        await interaction.response.send_message(content, embed=embed, ephemeral=ephemeral)
+
+@bot.tree.error
+async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    # a deferred command that raises would otherwise leave "Bot is thinking…" up until the token expires
+    name = interaction.command.name if interaction.command else "?"
+    print(f"⚠️ /{name} failed: {error!r}")
+    traceback.print_exception(type(error), error, error.__traceback__)
+    if isinstance(getattr(error, "original", None), sqlite3.Error):
+        conn.rollback()  # don't leave a half-done write holding the DB lock
+    try:
+        await respond(interaction, "❌ Something went wrong while running that command. Please try again.", ephemeral=True)
+    except discord.HTTPException:
+        pass
+
+def ack_latency_stats():
+    if not _ack_latencies:
+        return None
+    ordered = sorted(_ack_latencies)
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+    return {"count": len(ordered), "p50": pct(0.5), "p95": pct(0.95), "max": ordered[-1]}
+
+# =========================
+# ANNOUNCEMENTS (queued + digested)
+# =========================
+
+def queue_announcement(channel_id: int, kind: str, text: str):
+    c.execute("INSERT INTO announcement_queue (channel_id, kind, text, queued_at) VALUES (?, ?, ?, ?)",
+              (channel_id, kind, text, time.time()))
+    conn.commit()
+    _announce_wakeup.set()
+
+def pending_announcement_count() -> int:
+    c.execute("SELECT COUNT(*) FROM announcement_queue")
+    return c.fetchone()[0]
+
+def announce_budget_wait(channel_id: int, now: float) -> float:
+    """Seconds until this channel may be posted to again (0 if it has budget now)."""
+    wait = max(0.0, _announce_blocked_until.get(channel_id, 0) - now)
+    sent = _announce_sent_at.get(channel_id)
+    if sent:
+        while sent and now - sent[0] >= ANNOUNCE_RATE_PERIOD:
+            sent.popleft()
+        if len(sent) >= ANNOUNCE_RATE_LIMIT:
+            wait = max(wait, sent[0] + ANNOUNCE_RATE_PERIOD - now)
+    return wait
+
+async def post_announcement_batch(channel_id: int):
+    # one post per call: the oldest item's kind, plus every queued item of that kind that fits
+    c.execute("SELECT kind FROM announcement_queue WHERE channel_id=? ORDER BY id LIMIT 1", (channel_id,))
+    r = c.fetchone()
+    if not r:
+        return
+    kind = r[0]
+    c.execute("SELECT id, text FROM announcement_queue WHERE channel_id=? AND kind=? ORDER BY id", (channel_id, kind))
+    ids, texts, length = [], [], 0
+    for item_id, text in c.fetchall():
+        if texts and length + len(text) + 1 > 4000:  # embed description limit is 4096
+            break
+        ids.append(item_id)
+        texts.append(text)
+        length += len(text) + 1
+
+    channel = bot.get_partial_messageable(channel_id)
+    try:
+        if len(texts) == 1:
+            await channel.send(texts[0])
+        else:
+            title = ANNOUNCE_DIGEST_TITLES.get(kind, "📢 Announcements")
+            embed = discord.Embed(title=f"{title} ({len(texts)})", description="\n".join(texts), color=discord.Color.blurple())
+            await channel.send(embed=embed)
+    except (discord.Forbidden, discord.NotFound) as e:
+        # channel is gone or unusable; these will never post, so drop them
+        print(f"⚠️ Dropping {len(ids)} announcement(s) for channel {channel_id}: {e}")
+    except discord.HTTPException as e:
+        _announce_blocked_until[channel_id] = time.time() + ANNOUNCE_RETRY_SECONDS
+        attempts = _announce_failures.get(channel_id, 0) + 1
+        if attempts < ANNOUNCE_MAX_ATTEMPTS:
+            _announce_failures[channel_id] = attempts
+            print(f"⚠️ Announcement post failed for channel {channel_id}, retrying later: {e}")
+            return
+        print(f"⚠️ Dropping {len(ids)} announcement(s) for channel {channel_id} after {attempts} failed attempts: {e}")
+    else:
+        _announce_sent_at.setdefault(channel_id, deque()).append(time.time())
+    _announce_failures.pop(channel_id, None)
+
+    c.executemany("DELETE FROM announcement_queue WHERE id=?", [(i,) for i in ids])
+    conn.commit()
+
+async def run_announcement_flusher():
+    while True:
+        _announce_wakeup.clear()
+        now = time.time()
+        c.execute("SELECT channel_id, MIN(queued_at) FROM announcement_queue GROUP BY channel_id")
+        next_due = None
+        for channel_id, oldest in c.fetchall():
+            due = max(oldest + ANNOUNCE_DIGEST_WINDOW_SECONDS, now + announce_budget_wait(channel_id, now))
+            if due <= now:
+                await post_announcement_batch(channel_id)
+                due = time.time()  # more may be left for this channel; re-check straight away
+            next_due = due if next_due is None else min(next_due, due)
+
+        timeout = None if next_due is None else max(0.0, next_due - time.time())
         try:
-            dm = await u.create_dm()
-            await dm.send(text)
-            sent_any = True
-        except discord.Forbidden:
+            await asyncio.wait_for(_announce_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
             pass
 
-    if not sent_any:
-        sc_id = get_signing_channel(guild.id)
-        channel = guild.get_channel(sc_id) if sc_id else guild.system_channel
-        if channel:
-            await channel.send(text)
+# =========================
+# EVENT RECORDING (load-test capture; replay with replay.py)
+# =========================
 
-    _last_warn_at[team_role_id] = now
+# tables snapshotted at the start of a recording; *_id columns are pseudonymized
+RECORD_TABLES = ["players", "teams", "guild_settings", "guild_roles", "guild_admin_roles", "guild_rules", "guild_tiers"]
+RECORD_REDACTED_COLUMNS = {"player_name", "team_name"}
+
+def record_id(real_id: int | None) -> int | None:
+    if real_id is None:
+        return None
+    return _record_ids.setdefault(real_id, len(_record_ids) + 1)
+
+def record_event(kind: str, **fields):
+    global _record_count
+    if _record_file is None:
+        return
+    fields = {"e": kind, "t": round(time.time() - _record_started, 3), **fields}
+    _record_file.write(json.dumps(fields, separators=(",", ":")) + "\n")
+    _record_count += 1
+    if _record_count % 50 == 0:
+        _record_file.flush()
+
+def record_role_name(guild_id: int, name: str) -> str:
+    # role names only matter to the bot for the unconfigured name fallback
+    return name if name in get_roster_rules(guild_id).tracked_role_names else ""
+
+def start_recording(path: str):
+    global _record_file, _record_started
+    if _record_file is not None:
+        return
+    # pseudonyms and timestamps restart with each process, so each run starts a fresh recording
+    _record_file = gzip.open(path, "wt", encoding="utf-8") if path.endswith(".gz") else open(path, "w", encoding="utf-8")
+    _record_started = time.time()
+    record_event("header", v=1)
+
+    tables = {}
+    for table in RECORD_TABLES:
+        c.execute(f"SELECT * FROM {table}")
+        cols = [d[0] for d in c.description]
+        rows = []
+        for row in c.fetchall():
+            rows.append([record_id(v) if col.endswith("_id") else (None if col in RECORD_REDACTED_COLUMNS else v)
+                         for col, v in zip(cols, row)])
+        tables[table] = {"cols": cols, "rows": rows}
+    record_event("db", tables=tables)
+
+    for guild in bot.guilds:
+        record_event(
+            "guild", g=record_id(guild.id), owner=record_id(guild.owner_id), me=record_id(guild.me.id),
+            roles=[[record_id(r.id), r.position, record_role_name(guild.id, r.name)] for r in guild.roles],
+            members=[[record_id(m.id), [record_id(r.id) for r in m.roles]] for m in guild.members],
+        )
+    print(f"🎙️ Recording gateway events to {path}")
+
+def stop_recording():
+    # closing writes the gzip end-of-stream marker; without it the recording reads as truncated
+    global _record_file
+    if _record_file is not None:
+        _record_file.close()
+        _record_file = None
+
+def record_options(options: list) -> list:
+    out = []
+    for opt in options or []:
+        value = opt.get("value")
+        if opt.get("type") in (6, 7, 8, 9):  # user / channel / role / mentionable
+            value = record_id(int(value))
+        out.append([opt["name"], opt.get("type"), value])
+    return out
+
+@bot.listen("on_interaction")
+async def record_interaction(interaction: discord.Interaction):
+    if _record_file is None or interaction.type != discord.InteractionType.application_command:
+        return
+    data = interaction.data or {}
+    record_event(
+        "ix", g=record_id(interaction.guild_id), u=record_id(interaction.user.id),
+        ch=record_id(interaction.channel_id), cmd=data.get("name"), opts=record_options(data.get("options")),
+    )
+
+def record_rename(user_id: int) -> int:
+    _record_renames[user_id] = _record_renames.get(user_id, 0) + 1
+    return _record_renames[user_id]
+
+@bot.listen("on_member_update")
+async def record_member_update(before: discord.Member, after: discord.Member):
+    if _record_file is None:
+        return
+    renamed = before.display_name != after.display_name
+    if not renamed and {r.id for r in before.roles} == {r.id for r in after.roles}:
+        return
+    fields = {"n": record_rename(after.id)} if renamed else {}
+    record_event("mu", g=record_id(after.guild.id), u=record_id(after.id), roles=[record_id(r.id) for r in after.roles], **fields)
+
+@bot.listen("on_user_update")
+async def record_user_update(before: discord.User, after: discord.User):
+    if _record_file is None or before.display_name == after.display_name:
+        return
+    record_event("uu", u=record_id(after.id), n=record_rename(after.id))
+
+@bot.listen("on_message")
+async def record_dm_reply(message: discord.Message):
+    if _record_file is None or not isinstance(message.channel, discord.DMChannel):
+        return
+    content = message.content.lower()
+    if content in ("accept", "decline"):  # only signing replies matter; nothing else is kept
+        record_event("dm", u=record_id(message.author.id), c=content)
 
 # =========================
 # EVENTS
 # =========================
 
+def start_background_tasks():
+    global _announce_task, _snapshot_task, _player_flush_task
+    if _player_flush_task is None or _player_flush_task.done():
+        _player_flush_task = asyncio.create_task(run_player_details_flusher())
+    if _announce_task is None or _announce_task.done():
+        _announce_task = asyncio.create_task(run_announcement_flusher())
+    if SNAPSHOT_PATH and (_snapshot_task is None or _snapshot_task.done()):
+        _snapshot_task = asyncio.create_task(run_snapshot_writer())
+    if JOB_WORKERS > 0:
+        requeue_stale_jobs()
+        start_job_workers(JOB_WORKERS)
+
 @bot.event
 async def on_ready():
     print(f"✅ {bot.user} is online!")
+    # reconcile stored names/categories with whatever changed while we were offline
+    _stale_category_guilds.update(g.id for g in bot.guilds)
+    start_background_tasks()
+    if RECORD_EVENTS_PATH:
+        start_recording(RECORD_EVENTS_PATH)
     try:
         synced = await bot.tree.sync()
         print(f"🔄 Synced {len(synced)} slash commands.")
@@ -368,10 +1240,13 @@ async def on_ready():
 async def on_member_update(before: discord.Member, after: discord.Member):
     before_ids = {r.id for r in before.roles}
     after_ids  = {r.id for r in after.roles}
+    if before_ids != after_ids or before.display_name != after.display_name:
+        stage_player_details(after)
     if before_ids == after_ids:
         return
 
-    tracked = relevant_rank_role_ids(after.guild)
+    rules = get_roster_rules(after.guild.id)
+    tracked = rules.tracked_role_ids
     changed_ids = before_ids ^ after_ids
     if tracked:
         if not (changed_ids & tracked):
@@ -380,32 +1255,43 @@ async def on_member_update(before: discord.Member, after: discord.Member):
         # fallback by names if nothing configured
         before_names = {r.name for r in before.roles}
         after_names  = {r.name for r in after.roles}
-        name_tracked = set(TIER_CAPS.keys()) | {"Manager", "Co-Manager"}
-        if before_names == after_names or not ((before_names ^ after_names) & name_tracked):
+        if before_names == after_names or not ((before_names ^ after_names) & rules.tracked_role_names):
             return
 
-    team_role_id = get_player_team(after.id)
+    cached = _player_cache.get(after.id)
+    team_role_id = cached[2] if cached else None
     if team_role_id is None:
         return
     await check_team_caps_and_warn(after.guild, team_role_id)
 
+@bot.event
+async def on_user_update(before: discord.User, after: discord.User):
+    if before.display_name == after.display_name:
+        return
+    for guild in snapshot_guilds():
+        member = guild.get_member(after.id)
+        if member:
+            stage_player_details(member)
+
 # =========================
 # ADMIN: CUSTOM ADMIN ROLES
 # =========================
 
 @bot.tree.command(name="addadminrole", description="Add a role that can use league admin commands")
 async def addadminrole(interaction: discord.Interaction, role: discord.Role):
+    await defer_response(interaction)
     if not is_custom_admin(interaction.user):
-        await interaction.response.send_message("❌ You must be a league admin to use this.", ephemeral=True); return
+        await respond(interaction, "❌ You must be a league admin to use this.", ephemeral=True); return
     add_admin_role(interaction.guild.id, role.id)
-    await interaction.response.send_message(f"✅ Added league admin role: {role.mention}", ephemeral=True)
+    await respond(interaction, f"✅ Added league admin role: {role.mention}", ephemeral=True)
 
 @bot.tree.command(name="removeadminrole", description="Remove a role from league admins")
 async def removeadminrole(interaction: discord.Interaction, role: discord.Role):
+    await defer_response(interaction)
     if not is_custom_admin(interaction.user):
-        await interaction.response.send_message("❌ You must be a league admin to use this.", ephemeral=True); return
+        await respond(interaction, "❌ You must be a league admin to use this.", ephemeral=True); return
     remove_admin_role(interaction.guild.id, role.id)
-    await interaction.response.send_message(f"✅ Removed league admin role: {role.mention}", ephemeral=True)
+    await respond(interaction, f"✅ Removed league admin role: {role.mention}", ephemeral=True)
 
 @bot.tree.command(name="viewadminroles", description="List roles that can use league admin commands")
 async def viewadminroles(interaction: discord.Interaction):
@@ -421,23 +1307,39 @@ async def viewadminroles(interaction: discord.Interaction):
     mentions = [(interaction.guild.get_role(rid).mention if interaction.guild.get_role(rid) else f"`(deleted {rid})`") for rid in ids]
     await interaction.response.send_message("🛡️ League admin roles:\n• " + "\n• ".join(mentions), ephemeral=True)
 
+@bot.tree.command(name="acklatency", description="Show how quickly recent commands were acknowledged")
+async def acklatency(interaction: discord.Interaction):
+    if not is_custom_admin(interaction.user):
+        await interaction.response.send_message("❌ You must be a league admin to use this.", ephemeral=True); return
+    stats = ack_latency_stats()
+    if not stats:
+        await interaction.response.send_message("ℹ️ No deferred commands have run since startup.", ephemeral=True); return
+    embed = discord.Embed(title="⏱️ Acknowledgement Latency", color=discord.Color.green())
+    embed.description = f"Last {stats['count']} deferred commands (Discord's deadline is 3s)"
+    embed.add_field(name="p50", value=f"{stats['p50'] * 1000:.0f} ms", inline=True)
+    embed.add_field(name="p95", value=f"{stats['p95'] * 1000:.0f} ms", inline=True)
+    embed.add_field(name="max", value=f"{stats['max'] * 1000:.0f} ms", inline=True)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 # =========================
 # ADMIN: CHANNELS
 # =========================
 
 @bot.tree.command(name="setsigningchannel", description="Set the channel for signings announcements")
 async def setsigningchannel(interaction: discord.Interaction, channel: discord.TextChannel):
+    await defer_response(interaction)
     if not is_custom_admin(interaction.user):
-        await interaction.response.send_message("❌ You must be a league admin to use this.", ephemeral=True); return
+        await respond(interaction, "❌ You must be a league admin to use this.", ephemeral=True); return
     set_signing_channel(interaction.guild.id, channel.id)
-    await interaction.response.send_message(f"✅ Signings channel set to {channel.mention}", ephemeral=True)
+    await respond(interaction, f"✅ Signings channel set to {channel.mention}", ephemeral=True)
 
 @bot.tree.command(name="setreleasechannel", description="Set the channel for releases announcements")
 async def setreleasechannel(interaction: discord.Interaction, channel: discord.TextChannel):
+    await defer_response(interaction)
     if not is_custom_admin(interaction.user):
-        await interaction.response.send_message("❌ You must be a league admin to use this.", ephemeral=True); return
+        await respond(interaction, "❌ You must be a league admin to use this.", ephemeral=True); return
     set_release_channel(interaction.guild.id, channel.id)
-    await interaction.response.send_message(f"✅ Releases channel set to {channel.mention}", ephemeral=True)
+    await respond(interaction, f"✅ Releases channel set to {channel.mention}", ephemeral=True)
 
 @bot.tree.command(name="viewsettings", description="View the current announcement channel settings")
 async def viewsettings(interaction: discord.Interaction):
@@ -459,45 +1361,99 @@ async def viewsettings(interaction: discord.Interaction):
 
 @bot.tree.command(name="setmanagerrole", description="Set which role counts as Manager")
 async def setmanagerrole(interaction: discord.Interaction, role: discord.Role):
+    await defer_response(interaction)
     if not is_custom_admin(interaction.user):
-        await interaction.response.send_message("❌ You must be a league admin to use this.", ephemeral=True); return
+        await respond(interaction, "❌ You must be a league admin to use this.", ephemeral=True); return
     set_guild_role(interaction.guild.id, "manager", role.id)
-    await interaction.response.send_message(f"✅ Manager role set to {role.mention}", ephemeral=True)
+    await respond(interaction, f"✅ Manager role set to {role.mention}", ephemeral=True)
 
 @bot.tree.command(name="setcomanagerrole", description="Set which role counts as Co-Manager")
 async def setcomanagerrole(interaction: discord.Interaction, role: discord.Role):
+    await defer_response(interaction)
     if not is_custom_admin(interaction.user):
-        await interaction.response.send_message("❌ You must be a league admin to use this.", ephemeral=True); return
+        await respond(interaction, "❌ You must be a league admin to use this.", ephemeral=True); return
     set_guild_role(interaction.guild.id, "co_manager", role.id)
-    await interaction.response.send_message(f"✅ Co-Manager role set to {role.mention}", ephemeral=True)
+    await respond(interaction, f"✅ Co-Manager role set to {role.mention}", ephemeral=True)
+
+async def tier_autocomplete(interaction: discord.Interaction, current: str):
+    tiers = get_roster_rules(interaction.guild_id).tier_caps
+    return [app_commands.Choice(name=t, value=t) for t in tiers if current.lower() in t.lower()][:25]
 
 @bot.tree.command(name="settierrole", description="Set which role counts for a given tier")
 @app_commands.describe(tier="Choose the tier", role="Role that represents this tier")
-@app_commands.choices(tier=[
-    app_commands.Choice(name="TOP 1-3", value="t1_3"),
-    app_commands.Choice(name="TOP 4-10", value="t4_10"),
-    app_commands.Choice(name="TOP 11-20", value="t11_20"),
-])
-async def settierrole(interaction: discord.Interaction, tier: app_commands.Choice[str], role: discord.Role):
+@app_commands.autocomplete(tier=tier_autocomplete)
+async def settierrole(interaction: discord.Interaction, tier: str, role: discord.Role):
+    await defer_response(interaction)
     if not is_custom_admin(interaction.user):
-        await interaction.response.send_message("❌ You must be a league admin to use this.", ephemeral=True); return
-    set_guild_role(interaction.guild.id, tier.value, role.id)
-    await interaction.response.send_message(f"✅ Tier **{tier.name}** role set to {role.mention}", ephemeral=True)
+        await respond(interaction, "❌ You must be a league admin to use this.", ephemeral=True); return
+    if not set_tier_role(interaction.guild.id, tier, role.id):
+        await respond(interaction, f"❌ No tier named **{tier}**. Add it with `/addtier` first.", ephemeral=True); return
+    await respond(interaction, f"✅ Tier **{tier}** role set to {role.mention}", ephemeral=True)
+
+@bot.tree.command(name="addtier", description="Add a tier (or change an existing tier's cap)")
+@app_commands.describe(name="Tier name, e.g. TOP 1-3", cap="Max players of this tier per team", role="Role that represents this tier")
+async def addtier(interaction: discord.Interaction, name: str, cap: app_commands.Range[int, 0, 100], role: discord.Role | None = None):
+    await defer_response(interaction)
+    if not is_custom_admin(interaction.user):
+        await respond(interaction, "❌ You must be a league admin to use this.", ephemeral=True); return
+    name = name.strip()
+    if not name or name.lower() in ("manager", "co-manager", "co_manager", "unranked"):
+        await respond(interaction, "❌ That name is reserved. Pick another tier name.", ephemeral=True); return
+    upsert_tier(interaction.guild.id, name, cap, role.id if role else None)
+    await respond(interaction, f"✅ Tier **{name}** saved with a cap of **{cap}**" + (f" for {role.mention}." if role else "."), ephemeral=True)
+
+@bot.tree.command(name="removetier", description="Remove a tier from this server's roster rules")
+@app_commands.describe(tier="Tier to remove")
+@app_commands.autocomplete(tier=tier_autocomplete)
+async def removetier(interaction: discord.Interaction, tier: str):
+    await defer_response(interaction)
+    if not is_custom_admin(interaction.user):
+        await respond(interaction, "❌ You must be a league admin to use this.", ephemeral=True); return
+    if not remove_tier(interaction.guild.id, tier):
+        await respond(interaction, f"❌ No tier named **{tier}**.", ephemeral=True); return
+    await respond(interaction, f"✅ Removed tier **{tier}**. Its players now count as Unranked.", ephemeral=True)
+
+@bot.tree.command(name="setrosterlimits", description="Set the roster size and Manager/Co-Manager limits per team")
+@app_commands.describe(
+    max_team_size="Max players per team",
+    max_managers="Max Managers on a roster",
+    max_co_managers="Max Co-Managers on a roster"
+)
+async def setrosterlimits(
+    interaction: discord.Interaction,
+    max_team_size: app_commands.Range[int, 1, 500] | None = None,
+    max_managers: app_commands.Range[int, 0, 10] | None = None,
+    max_co_managers: app_commands.Range[int, 0, 10] | None = None,
+):
+    await defer_response(interaction)
+    if not is_custom_admin(interaction.user):
+        await respond(interaction, "❌ You must be a league admin to use this.", ephemeral=True); return
+    set_roster_limits(interaction.guild.id, max_team_size, max_managers, max_co_managers)
+    rules = get_roster_rules(interaction.guild.id)
+    await respond(
+        interaction,
+        f"✅ Roster limits: **{rules.max_team_size}** players, **{rules.max_managers}** Manager(s), "
+        f"**{rules.max_co_managers}** Co-Manager(s).",
+        ephemeral=True
+    )
 
 @bot.tree.command(name="viewroles", description="View the configured Manager/Co-Manager/Tier roles")
 async def viewroles(interaction: discord.Interaction):
     if not is_custom_admin(interaction.user):
         await interaction.response.send_message("❌ You must be a league admin to use this.", ephemeral=True); return
     cfg = get_guild_roles(interaction.guild.id)
+    rules = get_roster_rules(interaction.guild.id)
+    tier_roles = {cat[1]: rid for rid, (_, cat) in rules.role_categories.items() if isinstance(cat, tuple)}
     def fmt(rid):
         r = interaction.guild.get_role(rid) if rid else None
         return r.mention if r else "❌ Not Set"
     embed = discord.Embed(title="🛠️ Configured Rank Roles", color=discord.Color.orange())
+    embed.description = (f"Roster size: **{rules.max_team_size}** • Managers: **{rules.max_managers}** • "
+                         f"Co-Managers: **{rules.max_co_managers}**")
     embed.add_field(name="Manager", value=fmt(cfg["manager"]), inline=False)
     embed.add_field(name="Co-Manager", value=fmt(cfg["co_manager"]), inline=False)
-    embed.add_field(name="TOP 1-3", value=fmt(cfg["t1_3"]), inline=False)
-    embed.add_field(name="TOP 4-10", value=fmt(cfg["t4_10"]), inline=False)
-    embed.add_field(name="TOP 11-20", value=fmt(cfg["t11_20"]), inline=False)
+    for tier, cap in rules.tier_caps.items():
+        embed.add_field(name=f"{tier} (cap {cap})", value=fmt(tier_roles.get(tier)), inline=False)
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 # =========================
@@ -506,111 +1462,112 @@ async def viewroles(interaction: discord.Interaction):
 
 @bot.tree.command(name="registerteam", description="Add a pre-made role to the allowed pool of teams")
 async def registerteam(interaction: discord.Interaction, team: discord.Role):
+    await defer_response(interaction)
     if not is_custom_admin(interaction.user):
-        await interaction.response.send_message("❌ You must be a league admin to use this.", ephemeral=True); return
+        await respond(interaction, "❌ You must be a league admin to use this.", ephemeral=True); return
     register_team(team.id, team.name)
-    await interaction.response.send_message(f"✅ Registered **{team.name}** as a selectable team.", ephemeral=True)
+    await respond(interaction, f"✅ Registered **{team.name}** as a selectable team.", ephemeral=True)
 
 @bot.tree.command(name="createteam", description="Claim a registered team; grants you that team role (requires Manager rank role)")
 @app_commands.describe(team="Select the pre-registered team role to manage")
 async def createteam(interaction: discord.Interaction, team: discord.Role):
+    await defer_response(interaction)
     guild = interaction.guild
     user = interaction.user
 
     # Team must be registered
     rec = get_team_record(team.id)
     if not rec:
-        await interaction.response.send_message("❌ That team role is not registered yet. Ask a league admin to run `/registerteam` first.", ephemeral=True); return
+        await respond(interaction, "❌ That team role is not registered yet. Ask a league admin to run `/registerteam` first.", ephemeral=True); return
 
     # Caller must ALREADY have the configured Manager rank role (eligibility)
     manager_role, co_manager_role = ensure_rank_roles_exist(guild)
     if manager_role is None:
-        await interaction.response.send_message("❌ Missing required rank role: `Manager`. League admin: set it with `/setmanagerrole`.", ephemeral=True); return
+        await respond(interaction, "❌ Missing required rank role: `Manager`. League admin: set it with `/setmanagerrole`.", ephemeral=True); return
     if manager_role not in user.roles:
-        await interaction.response.send_message(f"❌ You need the {manager_role.mention} role to create/claim a team.", ephemeral=True); return
+        await respond(interaction, f"❌ You need the {manager_role.mention} role to create/claim a team.", ephemeral=True); return
 
     # Team cannot already have a manager
     if rec["manager_id"]:
         if rec["manager_id"] == user.id:
-            await interaction.response.send_message("ℹ️ You already manage this team.", ephemeral=True)
+            await respond(interaction, "ℹ️ You already manage this team.", ephemeral=True)
         else:
-            await interaction.response.send_message("❌ This team is already managed by someone else.", ephemeral=True)
+            await respond(interaction, "❌ This team is already managed by someone else.", ephemeral=True)
         return
 
-    # Enforce single manager on-roster
+    # Enforce the guild's Manager limit on-roster
     m_count, cm_count, _, _ = count_team_categories(team.id, guild)
-    if m_count >= 1:
-        await interaction.response.send_message("❌ This team already has a Manager on-roster.", ephemeral=True); return
+    if m_count >= get_roster_rules(guild.id).max_managers:
+        await respond(interaction, "❌ This team already has a Manager on-roster.", ephemeral=True); return
 
-    # If user is on a different team, remove that role first
+    # If user is on a different team, that role gets removed
     current_team_id = get_player_team(user.id)
-    if current_team_id and current_team_id != team.id:
-        old_role = guild.get_role(current_team_id)
-        try:
-            if old_role:
-                await user.remove_roles(old_role, reason="Moving to manage a new team")
-        except discord.Forbidden:
-            await interaction.response.send_message("❌ I don't have permission to remove your old team role.", ephemeral=True); return
-
-    # Grant the chosen team role (Manager role already present; do NOT change it)
-    try:
-        if team not in user.roles:
-            await user.add_roles(team, reason="Claimed team as Manager")
-    except discord.Forbidden:
-        await interaction.response.send_message("❌ I don't have permission to assign the team role.", ephemeral=True); return
-
-    # Persist
-    add_or_update_player(user.id, user.display_name, team.id)
+    old_role = guild.get_role(current_team_id) if current_team_id and current_team_id != team.id else None
+    if old_role and not can_manage_role(guild, old_role):
+        await respond(interaction, "❌ I don't have permission to remove your old team role.", ephemeral=True); return
+    if not can_manage_role(guild, team):
+        await respond(interaction, "❌ I don't have permission to assign the team role.", ephemeral=True); return
+
+    # Persist, then queue the role edits (Manager role already present; do NOT change it)
+    add_or_update_player(user.id, user.display_name, team.id, category_label(get_player_category(user)))
     set_team_manager(team.id, user.id)
+    if old_role:
+        queue_role_change(guild.id, user.id, old_role.id, add=False, reason="Moving to manage a new team", report_channel_id=interaction.channel_id)
+    if team not in user.roles:
+        queue_role_change(guild.id, user.id, team.id, add=True, reason="Claimed team as Manager", report_channel_id=interaction.channel_id)
 
-    await interaction.response.send_message(f"✅ You are now the **Manager** of **{team.name}** and have been given the team role.", ephemeral=True)
+    await respond(interaction, f"✅ You are now the **Manager** of **{team.name}**. Your team role is being added.", ephemeral=True)
 
 @bot.tree.command(name="setcomanager", description="(Manager only) Appoint a Co-Manager for your team")
 @app_commands.describe(team="Your team role", user="Member to appoint as Co-Manager")
 async def setcomanager(interaction: discord.Interaction, team: discord.Role, user: discord.Member):
+    await defer_response(interaction)
     guild = interaction.guild
     if not is_user_manager_of_team(interaction.user.id, team.id):
-        await interaction.response.send_message("❌ Only the current Manager of that team can set a Co-Manager.", ephemeral=True); return
+        await respond(interaction, "❌ Only the current Manager of that team can set a Co-Manager.", ephemeral=True); return
 
     _, co_manager_role = ensure_rank_roles_exist(guild)
     if co_manager_role is None:
-        await interaction.response.send_message("❌ Missing required rank role: `Co-Manager`.", ephemeral=True); return
+        await respond(interaction, "❌ Missing required rank role: `Co-Manager`.", ephemeral=True); return
 
     _, cm_count, _, _ = count_team_categories(team.id, guild)
-    if cm_count >= 1:
-        await interaction.response.send_message("❌ This team already has a Co-Manager on-roster.", ephemeral=True); return
+    if cm_count >= get_roster_rules(guild.id).max_co_managers:
+        await respond(interaction, "❌ This team already has a Co-Manager on-roster.", ephemeral=True); return
 
-    try:
-        if not is_user_on_team(user.id, team.id):
-            current_team_id = get_player_team(user.id)
-            if current_team_id and current_team_id != team.id:
-                old_role = guild.get_role(current_team_id)
-                if old_role:
-                    await user.remove_roles(old_role)
-            await user.add_roles(team)
-        await user.add_roles(co_manager_role)
-    except discord.Forbidden:
-        await interaction.response.send_message("❌ I don't have permission to assign roles.", ephemeral=True); return
+    joining = not is_user_on_team(user.id, team.id)
+    current_team_id = get_player_team(user.id)
+    old_role = guild.get_role(current_team_id) if joining and current_team_id and current_team_id != team.id else None
+    if not all(can_manage_role(guild, r) for r in (old_role, team, co_manager_role) if r):
+        await respond(interaction, "❌ I don't have permission to assign roles.", ephemeral=True); return
 
-    add_or_update_player(user.id, user.display_name, team.id)
+    add_or_update_player(user.id, user.display_name, team.id, "co_manager")
     set_team_co_manager(team.id, user.id)
-    await interaction.response.send_message(f"✅ {user.mention} is now **Co-Manager** of **{team.name}**.", ephemeral=True)
+    if old_role:
+        queue_role_change(guild.id, user.id, old_role.id, add=False, report_channel_id=interaction.channel_id)
+    if joining:
+        queue_role_change(guild.id, user.id, team.id, add=True, report_channel_id=interaction.channel_id)
+    queue_role_change(guild.id, user.id, co_manager_role.id, add=True, report_channel_id=interaction.channel_id)
+    await respond(interaction, f"✅ {user.mention} is now **Co-Manager** of **{team.name}**.", ephemeral=True)
 
 @bot.tree.command(name="listteams", description="Show registered teams and who manages them")
 async def listteams(interaction: discord.Interaction):
     guild = interaction.guild
-    c.execute("SELECT team_role_id, team_name, manager_id, co_manager_id FROM teams ORDER BY team_name COLLATE NOCASE")
+    c.execute("""
+        SELECT t.team_role_id, t.team_name, pm.player_name, pc.player_name
+        FROM teams t
+        LEFT JOIN players pm ON pm.player_id = t.manager_id
+        LEFT JOIN players pc ON pc.player_id = t.co_manager_id
+        ORDER BY t.team_name COLLATE NOCASE
+    """)
     rows = c.fetchall()
     if not rows:
         await interaction.response.send_message("ℹ️ No teams are registered yet. League admins can use `/registerteam`.", ephemeral=True); return
     lines = []
-    for role_id, team_name, manager_id, co_manager_id in rows:
+    for role_id, team_name, mgr_name, com_name in rows:
         role = guild.get_role(role_id)
         role_text = role.mention if role else f"{team_name} (role missing)"
-        mgr = guild.get_member(manager_id) if manager_id else None
-        com = guild.get_member(co_manager_id) if co_manager_id else None
-        mgr_text = mgr.display_name if mgr else "—"
-        com_text = com.display_name if com else "—"
+        mgr_text = mgr_name or "—"
+        com_text = com_name or "—"
         lines.append(f"{role_text}\n  • Manager: {mgr_text}\n  • Co-Manager: {com_text}")
     embed = discord.Embed(title="📜 Registered Teams", description="\n\n".join(lines), color=discord.Color.blurple())
     await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -625,60 +1582,57 @@ async def listteams(interaction: discord.Interaction):
     make_old_co_manager="If true, demote the old Manager to Co-Manager for this team"
 )
 async def transferteam(interaction: discord.Interaction, team: discord.Role, new_manager: discord.Member, make_old_co_manager: bool = False):
+    await defer_response(interaction)
     if not is_custom_admin(interaction.user):
-        await interaction.response.send_message("❌ You must be a league admin to use this.", ephemeral=True); return
+        await respond(interaction, "❌ You must be a league admin to use this.", ephemeral=True); return
 
     guild = interaction.guild
     rec = get_team_record(team.id)
     if not rec:
-        await interaction.response.send_message("❌ That team role is not registered. Use `/registerteam` first.", ephemeral=True); return
+        await respond(interaction, "❌ That team role is not registered. Use `/registerteam` first.", ephemeral=True); return
 
     manager_role, co_manager_role = ensure_rank_roles_exist(guild)
     if manager_role is None:
-        await interaction.response.send_message("❌ Missing required rank role: `Manager`.", ephemeral=True); return
+        await respond(interaction, "❌ Missing required rank role: `Manager`.", ephemeral=True); return
     if make_old_co_manager and co_manager_role is None:
-        await interaction.response.send_message("❌ Missing required rank role: `Co-Manager`.", ephemeral=True); return
+        await respond(interaction, "❌ Missing required rank role: `Co-Manager`.", ephemeral=True); return
 
     old_manager_member = guild.get_member(rec["manager_id"]) if rec["manager_id"] else None
 
     current_team_id = get_player_team(new_manager.id)
-    if current_team_id and current_team_id != team.id:
-        old_team_role = guild.get_role(current_team_id)
-        try:
-            if old_team_role:
-                await new_manager.remove_roles(old_team_role)
-        except discord.Forbidden:
-            await interaction.response.send_message("❌ Can't modify roles for the new manager (permissions).", ephemeral=True); return
-
-    try:
-        if team not in new_manager.roles:
-            await new_manager.add_roles(team)
-        if manager_role not in new_manager.roles:
-            await new_manager.add_roles(manager_role)
-    except discord.Forbidden:
-        await interaction.response.send_message("❌ Can't assign Manager/team roles to the new manager.", ephemeral=True); return
-
-    add_or_update_player(new_manager.id, new_manager.display_name, team.id)
+    old_team_role = guild.get_role(current_team_id) if current_team_id and current_team_id != team.id else None
+    if old_team_role and not can_manage_role(guild, old_team_role):
+        await respond(interaction, "❌ Can't modify roles for the new manager (permissions).", ephemeral=True); return
+    if not (can_manage_role(guild, team) and can_manage_role(guild, manager_role)):
+        await respond(interaction, "❌ Can't assign Manager/team roles to the new manager.", ephemeral=True); return
+    if make_old_co_manager and not can_manage_role(guild, co_manager_role):
+        await respond(interaction, "❌ Can't assign the Co-Manager role to the old manager (permissions).", ephemeral=True); return
+
+    add_or_update_player(new_manager.id, new_manager.display_name, team.id, "manager")
     set_team_manager(team.id, new_manager.id)
+    if old_team_role:
+        queue_role_change(guild.id, new_manager.id, old_team_role.id, add=False, report_channel_id=interaction.channel_id)
+    if team not in new_manager.roles:
+        queue_role_change(guild.id, new_manager.id, team.id, add=True, report_channel_id=interaction.channel_id)
+    if manager_role not in new_manager.roles:
+        queue_role_change(guild.id, new_manager.id, manager_role.id, add=True, report_channel_id=interaction.channel_id)
 
     if old_manager_member and old_manager_member.id != new_manager.id:
-        try:
-            if manager_role in old_manager_member.roles:
-                await old_manager_member.remove_roles(manager_role)
-            if make_old_co_manager:
-                if team not in old_manager_member.roles:
-                    await old_manager_member.add_roles(team)
-                if co_manager_role not in old_manager_member.roles:
-                    await old_manager_member.add_roles(co_manager_role)
-                add_or_update_player(old_manager_member.id, old_manager_member.display_name, team.id)
-                set_team_co_manager(team.id, old_manager_member.id)
-            else:
-                if rec["co_manager_id"] == old_manager_member.id:
-                    set_team_co_manager(team.id, None)
-        except discord.Forbidden:
-            await interaction.response.send_message("⚠️ Transferred, but couldn't update roles for the old manager.", ephemeral=True); return
-
-    await interaction.response.send_message(
+        if make_old_co_manager:
+            add_or_update_player(old_manager_member.id, old_manager_member.display_name, team.id, "co_manager")
+            set_team_co_manager(team.id, old_manager_member.id)
+        elif rec["co_manager_id"] == old_manager_member.id:
+            set_team_co_manager(team.id, None)
+        if manager_role in old_manager_member.roles:
+            queue_role_change(guild.id, old_manager_member.id, manager_role.id, add=False, report_channel_id=interaction.channel_id)
+        if make_old_co_manager:
+            if team not in old_manager_member.roles:
+                queue_role_change(guild.id, old_manager_member.id, team.id, add=True, report_channel_id=interaction.channel_id)
+            if co_manager_role not in old_manager_member.roles:
+                queue_role_change(guild.id, old_manager_member.id, co_manager_role.id, add=True, report_channel_id=interaction.channel_id)
+
+    await respond(
+        interaction,
         f"✅ Transferred **{team.name}** manager to **{new_manager.display_name}**"
         + (" and set the previous manager as **Co-Manager**." if (old_manager_member and make_old_co_manager) else "."),
         ephemeral=True
@@ -691,32 +1645,32 @@ async def transferteam(interaction: discord.Interaction, team: discord.Role, new
 @bot.tree.command(name="sign", description="Sign a player to your team (requires their approval)")
 @app_commands.describe(team="Select the team role", player="Player to sign")
 async def sign(interaction: discord.Interaction, team: discord.Role, player: discord.Member):
+    await defer_response(interaction)
     guild = interaction.guild
 
     # Only that team's Manager or Co-Manager can sign to that team
     if not (is_user_manager_of_team(interaction.user.id, team.id) or is_user_co_manager_of_team(interaction.user.id, team.id)):
-        await interaction.response.send_message("❌ You must be this team’s **Manager** or **Co-Manager** to sign players to it.", ephemeral=True); return
-
-    manager_count, co_manager_count, tier_counts, unranked_count = count_team_categories(team.id, guild)
-    total_roster = manager_count + co_manager_count + sum(tier_counts.values()) + unranked_count
-    if total_roster >= MAX_TEAM_SIZE:
-        await interaction.response.send_message(f"❌ Team roster is full ({MAX_TEAM_SIZE}).", ephemeral=True); return
-
-    player_cat = get_player_category(player)
-    if player_cat == "manager" and manager_count >= 1:
-        await interaction.response.send_message("❌ Manager spot already filled.", ephemeral=True); return
-    if player_cat == "co_manager" and co_manager_count >= 1:
-        await interaction.response.send_message("❌ Co-Manager spot already filled.", ephemeral=True); return
-    if isinstance(player_cat, tuple) and player_cat[0] == "tiered":
-        tier_name = player_cat[1]
-        if tier_counts[tier_name] >= TIER_CAPS[tier_name]:
-            await interaction.response.send_message(f"❌ Tier {tier_name} is full.", ephemeral=True); return
+        await respond(interaction, "❌ You must be this team’s **Manager** or **Co-Manager** to sign players to it.", ephemeral=True); return
+
+    rules = get_roster_rules(guild.id)
+    blocked = rules.signing_block(count_stored_categories(rules, team.id), rules.category_of(player))
+    if blocked:
+        await respond(interaction, blocked, ephemeral=True); return
+
+    # Make sure the role edits can happen before asking the player to accept
+    current_team_id = get_player_team(player.id)
+    old_team_role = guild.get_role(current_team_id) if current_team_id and current_team_id != team.id else None
+    if old_team_role and not can_manage_role(guild, old_team_role):
+        await respond(interaction, "❌ I don't have permission to remove the player's current team role.", ephemeral=True); return
+    if not can_manage_role(guild, team):
+        await respond(interaction, "❌ I don't have permission to assign the team role.", ephemeral=True); return
 
     # DM approval for ALL players
+    await send_progress(interaction, f"⏳ Sending signing request to {player.display_name}…")
     try:
         dm = await player.create_dm()
         await dm.send(f"✍️ Signing Request: You are being signed to **{team.name}**. Type `accept` or `decline`.")
-        await interaction.response.send_message(f"✅ Signing request sent to {player.display_name}.", ephemeral=True)
+        await respond(interaction, f"✅ Signing request sent to {player.display_name}.", ephemeral=True)
 
         def check(m: discord.Message):
             return m.author == player and m.content.lower() in ("accept", "decline")
@@ -726,17 +1680,16 @@ async def sign(interaction: discord.Interaction, team: discord.Role, player: dis
             if msg.content.lower() == "accept":
                 current_team_id = get_player_team(player.id)
                 old_team_role = guild.get_role(current_team_id) if current_team_id else None
+                add_or_update_player(player.id, player.display_name, team.id, category_label(get_player_category(player)))
                 if old_team_role:
-                    await player.remove_roles(old_team_role)
-                await player.add_roles(team)
-                add_or_update_player(player.id, player.display_name, team.id)
+                    queue_role_change(guild.id, player.id, old_team_role.id, add=False, report_channel_id=interaction.channel_id)
+                queue_role_change(guild.id, player.id, team.id, add=True, report_channel_id=interaction.channel_id)
 
-                sc_id = get_signing_channel(guild.id)
-                channel = guild.get_channel(sc_id) if sc_id else interaction.channel
+                sc_id = get_signing_channel(guild.id) or interaction.channel_id
                 if old_team_role:
-                    await channel.send(f"✍️ {team.name} has signed {player.display_name} from {old_team_role.name}!")
+                    queue_announcement(sc_id, "signing", f"✍️ {team.name} has signed {player.display_name} from {old_team_role.name}!")
                 else:
-                    await channel.send(f"✍️ {team.name} has signed {player.display_name} (Free Agent)!")
+                    queue_announcement(sc_id, "signing", f"✍️ {team.name} has signed {player.display_name} (Free Agent)!")
                 await dm.send(f"✅ You have been signed to {team.name}!")
 
                 await check_team_caps_and_warn(guild, team.id)
@@ -747,7 +1700,7 @@ async def sign(interaction: discord.Interaction, team: discord.Role, player: dis
             await dm.send("⏳ Signing request expired.")
             await interaction.followup.send(f"{player.display_name} did not respond. Signing expired.", ephemeral=True)
     except discord.Forbidden:
-        await interaction.response.send_message(f"❌ Cannot DM {player.display_name}. Signing cancelled.", ephemeral=True)
+        await respond(interaction, f"❌ Cannot DM {player.display_name}. Signing cancelled.", ephemeral=True)
 
 @bot.tree.command(name="release", description="Release a player from their team")
 @app_commands.describe(player="Player to release")
@@ -760,45 +1713,52 @@ async def release(interaction: discord.Interaction, player: discord.Member):
         await interaction.response.send_message("❌ You must be this player’s team **Manager** or **Co-Manager** to release them.", ephemeral=True); return
 
     team_role = interaction.guild.get_role(team_id)
-    await player.remove_roles(team_role)
+    if team_role is None:
+        await interaction.response.send_message("❌ That player's team role no longer exists.", ephemeral=True); return
+    if not can_manage_role(interaction.guild, team_role):
+        await interaction.response.send_message("❌ I don't have permission to remove the team role.", ephemeral=True); return
+
+    # checks above are cache/DB-only; defer (publicly, like the result) before any role/DB writes
+    await defer_response(interaction, ephemeral=False)
     remove_player_from_team(player.id)
+    queue_role_change(interaction.guild.id, player.id, team_id, add=False, report_channel_id=interaction.channel_id)
 
-    rc_id = get_release_channel(interaction.guild.id)
-    channel = interaction.guild.get_channel(rc_id) if rc_id else interaction.channel
-    await channel.send(f"🗞️ {player.display_name} has been released from {team_role.name}.")
-    await interaction.response.send_message(f"✅ Released {player.display_name} from {team_role.name}.")
+    rc_id = get_release_channel(interaction.guild.id) or interaction.channel_id
+    queue_announcement(rc_id, "release", f"🗞️ {player.display_name} has been released from {team_role.name}.")
+    await respond(interaction, f"✅ Released {player.display_name} from {team_role.name}.")
 
 @bot.tree.command(name="roster", description="Check a team's roster")
 @app_commands.describe(team="Select the team role")
 async def roster(interaction: discord.Interaction, team: discord.Role):
     guild = interaction.guild
 
+    rules = get_roster_rules(guild.id)
+
     managers, co_managers = [], []
-    tiered_players = {tier: [] for tier in TIER_CAPS}
+    tiered_players = {tier: [] for tier in rules.tier_caps}
     unranked_players = []
 
-    for m in guild.members:
-        if get_player_team(m.id) == team.id:
-            cat = get_player_category(m)
-            if cat == "manager":
-                managers.append(m.display_name)
-            elif cat == "co_manager":
-                co_managers.append(m.display_name)
-            elif isinstance(cat, tuple) and cat[0] == "tiered":
-                tiered_players[cat[1]].append(m.display_name)
-            else:
-                unranked_players.append(m.display_name)
+    for _, name, category in get_team_roster(team.id):
+        cat = stored_category(rules, category)
+        if cat == "manager":
+            managers.append(name)
+        elif cat == "co_manager":
+            co_managers.append(name)
+        elif isinstance(cat, tuple):
+            tiered_players[cat[1]].append(name)
+        else:
+            unranked_players.append(name)
 
     total = len(managers) + len(co_managers) + sum(len(v) for v in tiered_players.values()) + len(unranked_players)
-    remaining = MAX_TEAM_SIZE - total
+    remaining = rules.max_team_size - total
 
     embed = discord.Embed(title=f"🏆 {team.name} Roster", color=discord.Color.blue())
-    embed.description = f"**Total: {total}/{MAX_TEAM_SIZE} players**"
+    embed.description = f"**Total: {total}/{rules.max_team_size} players**"
 
-    embed.add_field(name=f"Managers ({len(managers)}/1)", value="\n".join(managers) if managers else "None", inline=False)
-    embed.add_field(name=f"Co-Managers ({len(co_managers)}/1)", value="\n".join(co_managers) if co_managers else "None", inline=False)
+    embed.add_field(name=f"Managers ({len(managers)}/{rules.max_managers})", value="\n".join(managers) if managers else "None", inline=False)
+    embed.add_field(name=f"Co-Managers ({len(co_managers)}/{rules.max_co_managers})", value="\n".join(co_managers) if co_managers else "None", inline=False)
 
-    for tier, cap in TIER_CAPS.items():
+    for tier, cap in rules.tier_caps.items():
         names = tiered_players[tier]
         embed.add_field(name=f"{tier} ({len(names)}/{cap})", value="\n".join(names) if names else "None", inline=False)
 
@@ -814,4 +1774,12 @@ async def roster(interaction: discord.Interaction, team: discord.Role):
 if __name__ == "__main__":
     if not TOKEN:
         raise RuntimeError("DISCORD_TOKEN env var not set.")
-    bot.run(TOKEN)
+    if "--worker" in sys.argv:
+        asyncio.run(run_worker_process())
+    else:
+        # SIGTERM (e.g. a service stop) would otherwise kill the process without closing the recording
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        try:
+            bot.run(TOKEN)
+        finally:
+            stop_recording()
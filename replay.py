@@ -0,0 +1,428 @@
+"""Replay a recorded gateway event stream (see RECORD_EVENTS in bot.py) against
+the bot's real handlers, with Discord replaced by in-memory stubs.
+
+    python replay.py events.ndjson.gz [--speed 1] [--http-latency 0.05]
+
+--speed 1 replays at recorded pace, 4 at four times that, 0 as fast as possible.
+Reports throughput, event-loop lag and job/announcement queue depths.
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import datetime
+
+# =========================
+# STUB DISCORD OBJECTS
+# =========================
+
+http_calls: dict[str, int] = {}
+http_latency = 0.0
+
+async def stub_http_call(name: str):
+    http_calls[name] = http_calls.get(name, 0) + 1
+    if http_latency:
+        await asyncio.sleep(http_latency)
+
+class StubPermissions:
+    def __init__(self, administrator=False, manage_roles=False):
+        self.administrator = administrator
+        self.manage_roles = manage_roles
+
+class StubRole:
+    def __init__(self, guild, role_id, position=0, name=""):
+        self.guild = guild
+        self.id = role_id
+        self.position = position
+        self.name = name or f"role-{role_id}"
+        self.mention = f"<@&{role_id}>"
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __lt__(self, other):
+        return (self.position, self.id) < (other.position, other.id)
+
+class StubChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.mention = f"<#{channel_id}>"
+
+    async def send(self, content=None, **kwargs):
+        await stub_http_call("send_message")
+
+class StubMember:
+    def __init__(self, guild, member_id, role_ids=()):
+        self.guild = guild
+        self.id = member_id
+        self.role_ids = list(role_ids)
+        self.display_name = self.name = f"user-{member_id}"
+        self.mention = f"<@{member_id}>"
+        self.guild_permissions = StubPermissions(manage_roles=True)
+
+    @property
+    def roles(self):
+        return [self.guild.get_or_create_role(rid) for rid in self.role_ids]
+
+    @property
+    def top_role(self):
+        return max(self.roles, default=StubRole(self.guild, 0))
+
+    def copy(self):
+        member = StubMember(self.guild, self.id, self.role_ids)
+        member.display_name = member.name = self.display_name
+        return member
+
+    async def create_dm(self):
+        await stub_http_call("create_dm")
+        return StubChannel(self.id)
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+class StubGuild:
+    def __init__(self, guild_id, owner_id=None, me_id=None):
+        self.id = guild_id
+        self.owner_id = owner_id
+        self.me_id = me_id
+        self.roles_by_id: dict[int, StubRole] = {}
+        self.members_by_id: dict[int, StubMember] = {}
+        self.system_channel = None
+
+    @property
+    def members(self):
+        return list(self.members_by_id.values())
+
+    @property
+    def owner(self):
+        return self.get_member(self.owner_id)
+
+    @property
+    def me(self):
+        return self.get_member(self.me_id)
+
+    def get_role(self, role_id):
+        return self.roles_by_id.get(role_id)
+
+    def get_or_create_role(self, role_id):
+        if role_id not in self.roles_by_id:
+            self.roles_by_id[role_id] = StubRole(self, role_id)
+        return self.roles_by_id[role_id]
+
+    def get_member(self, member_id):
+        return self.members_by_id.get(member_id)
+
+    def get_or_create_member(self, member_id):
+        if member_id not in self.members_by_id:
+            self.members_by_id[member_id] = StubMember(self, member_id)
+        return self.members_by_id[member_id]
+
+    def get_channel(self, channel_id):
+        return StubChannel(channel_id)
+
+class StubHTTP:
+    """Stands in for bot.http; role edits only cost a call. The recording already holds the
+    member updates the bot's own edits caused, so those "mu" events are the one source of role state."""
+    async def close(self):
+        pass
+
+    async def add_role(self, guild_id, user_id, role_id, *, reason=None):
+        await stub_http_call("add_role")
+
+    async def remove_role(self, guild_id, user_id, role_id, *, reason=None):
+        await stub_http_call("remove_role")
+
+class StubResponse:
+    def __init__(self):
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def defer(self, **kwargs):
+        await stub_http_call("interaction_defer")
+        self.done = True
+
+    async def send_message(self, *args, **kwargs):
+        await stub_http_call("interaction_respond")
+        self.done = True
+
+class StubFollowup:
+    async def send(self, *args, **kwargs):
+        await stub_http_call("followup_send")
+
+class StubInteraction:
+    def __init__(self, command, guild, user, channel_id):
+        self.command = command
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel_id = channel_id
+        self.channel = StubChannel(channel_id)
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.response = StubResponse()
+        self.followup = StubFollowup()
+
+    async def edit_original_response(self, **kwargs):
+        await stub_http_call("interaction_edit")
+
+async def stub_create_dm(user):
+    await stub_http_call("create_dm")
+    return StubChannel(user.id)
+
+class StubMessage:
+    def __init__(self, author, content):
+        self.author = author
+        self.content = content
+
+# =========================
+# REPLAY
+# =========================
+
+def read_events(path: str):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if not line.endswith("\n"):
+                    raise EOFError("last line is incomplete")
+                if line.strip():
+                    yield json.loads(line)
+        except EOFError as e:
+            # the recorder was killed before closing the file; everything up to the cut is still usable
+            print(f"⚠️ {path} ends abruptly ({e}); replaying the complete lines before it")
+
+def load_db_snapshot(tables: dict):
+    for table, data in tables.items():
+        cols = data["cols"]
+        placeholders = ", ".join("?" for _ in cols)
+        for n, row in enumerate(data["rows"], start=1):
+            # redacted name columns are NOT NULL in the schema; fill a stand-in per row
+            row = [f"{col}-{n}" if v is None and col in bot.RECORD_REDACTED_COLUMNS else v
+                   for col, v in zip(cols, row)]
+            bot.c.execute(f"INSERT OR REPLACE INTO {table} ({', '.join(cols)}) VALUES ({placeholders})", row)
+    bot.conn.commit()
+    bot.migrate_legacy_tier_roles()  # recordings from before per-guild rules
+    bot._rules_cache.clear()
+    bot.load_player_cache()
+
+def load_guild(ev: dict, guilds: dict):
+    guild = StubGuild(ev["g"], ev["owner"], ev["me"])
+    for role_id, position, name in ev["roles"]:
+        guild.roles_by_id[role_id] = StubRole(guild, role_id, position, name)
+    for member_id, role_ids in ev["members"]:
+        guild.members_by_id[member_id] = StubMember(guild, member_id, role_ids)
+    guilds[guild.id] = guild
+
+def resolve_option(cmd, guild, name, opt_type, value):
+    if opt_type in (6, 9):
+        return guild.get_or_create_member(value)
+    if opt_type == 8:
+        return guild.get_or_create_role(value)
+    if opt_type == 7:
+        return StubChannel(value)
+    param = cmd.get_parameter(name)
+    if param is not None and param.choices:
+        return next((ch for ch in param.choices if ch.value == value), value)
+    return value
+
+def stand_in_name(user_id: int, renames: int) -> str:
+    # recordings keep only how many times a name changed, never the name
+    return f"user-{user_id}~{renames}"
+
+def dispatch_event(ev: dict, guilds: dict, tasks: set, stats: dict, held_dms: list):
+    kind = ev["e"]
+    if kind == "mu":
+        guild = guilds.get(ev["g"])
+        if guild is None:
+            return
+        member = guild.get_or_create_member(ev["u"])
+        before = member.copy()
+        member.role_ids = list(ev["roles"])
+        if "n" in ev:
+            member.display_name = member.name = stand_in_name(ev["u"], ev["n"])
+        bot.bot.dispatch("member_update", before, member)
+    elif kind == "uu":
+        # a global-name change shows in every guild the user is in (nicknames aside)
+        before = after = None
+        for guild in guilds.values():
+            member = guild.get_member(ev["u"])
+            if member:
+                before = before or member.copy()
+                member.display_name = member.name = stand_in_name(ev["u"], ev["n"])
+                after = after or member
+        if after is None:
+            return
+        bot.bot.dispatch("user_update", before, after)
+    elif kind == "ix":
+        cmd = bot.bot.tree.get_command(ev["cmd"])
+        guild = guilds.get(ev["g"])
+        if cmd is None or guild is None:
+            stats["skipped"] += 1
+            return
+        kwargs = {name: resolve_option(cmd, guild, name, t, v) for name, t, v in ev["opts"]}
+        interaction = StubInteraction(cmd, guild, guild.get_or_create_member(ev["u"]), ev["ch"])
+        task = asyncio.create_task(cmd.callback(interaction, **kwargs))
+        tasks.add(task)
+
+        def finished(t: asyncio.Task):
+            tasks.discard(t)
+            if not t.cancelled() and t.exception() is not None:
+                stats["errors"] += 1
+                print(f"⚠️ /{ev['cmd']} raised {t.exception()!r}")
+        task.add_done_callback(finished)
+    elif kind == "dm":
+        for guild in guilds.values():
+            member = guild.get_member(ev["u"])
+            if member:
+                # delivered once the handler it answers is waiting for it (see deliver_held_dms)
+                held_dms.append(StubMessage(member, ev["c"]))
+                break
+    else:
+        return
+    stats["events"] += 1
+
+def has_dm_waiter(message: StubMessage) -> bool:
+    for future, condition in bot.bot._listeners.get("message", []):
+        if future.done():
+            continue
+        try:
+            if condition(message):
+                return True
+        except Exception:
+            continue
+    return False
+
+async def deliver_held_dms(held_dms: list, interval: float = 0.01):
+    # the feed can outrun the handlers (always at --speed 0), so a recorded reply may arrive
+    # before its /sign reaches wait_for; hold it until a waiter would accept it
+    while True:
+        for message in list(held_dms):
+            if has_dm_waiter(message):
+                held_dms.remove(message)
+                bot.bot.dispatch("message", message)
+        await asyncio.sleep(interval)
+
+async def sample_loop_lag(lags: list, interval: float = 0.05):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+async def sample_queue_depths(depths: list, tasks: set, interval: float = 0.5):
+    while True:
+        depths.append((bot.pending_job_count(), bot.pending_announcement_count(), len(tasks), len(bot._pending_player_details)))
+        await asyncio.sleep(interval)
+
+def pct(values: list, p: float):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+async def replay(path: str, speed: float, drain_timeout: float):
+    guilds: dict[int, StubGuild] = {}
+    tasks: set[asyncio.Task] = set()
+    held_dms: list[StubMessage] = []
+    stats = {"events": 0, "skipped": 0, "errors": 0}
+    lags, depths = [], []
+
+    async with bot.bot:
+        bot.bot.http = StubHTTP()
+        bot.bot.get_partial_messageable = lambda channel_id, **kw: StubChannel(channel_id)
+        bot.bot.create_dm = stub_create_dm
+        bot.snapshot_guilds = lambda: list(guilds.values())
+        bot.start_background_tasks()
+        samplers = [asyncio.create_task(sample_loop_lag(lags)), asyncio.create_task(sample_queue_depths(depths, tasks)),
+                    asyncio.create_task(deliver_held_dms(held_dms))]
+
+        started = time.perf_counter()
+        for ev in read_events(path):
+            if ev["e"] == "db":
+                load_db_snapshot(ev["tables"])
+                continue
+            if ev["e"] == "guild":
+                load_guild(ev, guilds)
+                # what on_ready does: reconcile stored names/categories with the guild
+                bot._stale_category_guilds.add(ev["g"])
+                bot.flush_player_details()
+                continue
+            if speed > 0:
+                delay = started + ev["t"] / speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            dispatch_event(ev, guilds, tasks, stats, held_dms)
+            await asyncio.sleep(0)
+        fed = time.perf_counter() - started
+
+        # let jobs, announcements and held DM replies finish; handlers still open once things
+        # go quiet are parked in wait_for (e.g. /sign whose DM reply never came) and are left alone
+        deadline = time.perf_counter() + drain_timeout
+        quiet_since, open_counts = time.perf_counter(), (len(tasks), len(held_dms))
+        while time.perf_counter() < deadline:
+            if (len(tasks), len(held_dms)) != open_counts:
+                quiet_since, open_counts = time.perf_counter(), (len(tasks), len(held_dms))
+            busy = bot.pending_job_count() or bot.pending_announcement_count()
+            if not busy and (not (tasks or held_dms) or time.perf_counter() - quiet_since > 2):
+                break
+            await asyncio.sleep(0.1)
+        drained = time.perf_counter() - started
+
+        for t in samplers + list(tasks):
+            t.cancel()
+
+        # the periodic name flush may not have come round yet; time the one that's left
+        name_rows = len(bot._pending_player_details)
+        flush_started = time.perf_counter()
+        bot.flush_player_details()
+        name_flush = time.perf_counter() - flush_started
+
+    print(f"Events replayed:   {stats['events']} ({stats['skipped']} skipped, {stats['errors']} handler errors)")
+    print(f"Feed time:         {fed:.2f}s  ->  {stats['events'] / fed if fed else 0:.1f} events/s")
+    print(f"Drain time:        {drained:.2f}s (pending after drain: {len(tasks)} handlers, "
+          f"{bot.pending_job_count()} jobs, {bot.pending_announcement_count()} announcements, "
+          f"{len(held_dms)} undelivered DM replies)")
+    print(f"Event-loop lag:    p50 {pct(lags, 0.5) * 1000:.1f}ms  p95 {pct(lags, 0.95) * 1000:.1f}ms  "
+          f"max {max(lags, default=0) * 1000:.1f}ms")
+    for i, label in enumerate(("Job queue", "Announce queue", "Open handlers", "Pending names")):
+        values = [d[i] for d in depths]
+        print(f"{label + ':':<19}max {max(values, default=0)}  avg {sum(values) / len(values) if values else 0:.1f}")
+    ack = bot.ack_latency_stats()
+    if ack:
+        print(f"Ack latency:       p50 {ack['p50'] * 1000:.1f}ms  p95 {ack['p95'] * 1000:.1f}ms  max {ack['max'] * 1000:.1f}ms")
+    print(f"Final name flush:  {name_rows} rows in {name_flush * 1000:.1f}ms")
+    print("HTTP calls:        " + ", ".join(f"{k}={v}" for k, v in sorted(http_calls.items())))
+    print(f"Snapshot:          {len(bot._snapshot_teams)} teams in {bot.SNAPSHOT_PATH}")
+
+# =========================
+# RUN
+# =========================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded event stream against the bot's handlers.")
+    parser.add_argument("path", help="recording written by the bot with RECORD_EVENTS set")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = recorded pace, 0 = as fast as possible")
+    parser.add_argument("--http-latency", type=float, default=0.05, help="simulated seconds per Discord HTTP call")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="max seconds to wait for queues to empty")
+    args = parser.parse_args()
+
+    # replay against a throwaway DB and snapshot, never the live ones
+    workdir = tempfile.mkdtemp(prefix="replay-")
+    os.environ["ROSTER_DB"] = os.path.join(workdir, "roster.db")
+    os.environ["SNAPSHOT_PATH"] = os.path.join(workdir, "standings.json")
+    os.environ.pop("RECORD_EVENTS", None)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import bot
+
+    http_latency = args.http_latency
+    asyncio.run(replay(args.path, args.speed, args.drain_timeout))